@@ -5,6 +5,11 @@ import argparse
 import csv
 from pathlib import Path
 
+# Size of the text blocks streamed by the fast conversion path.
+CHUNK_SIZE = 1 << 20
+# Rows handed to csv.writer.writerows at once by the safe conversion path.
+SAFE_BATCH_ROWS = 10000
+
 
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
@@ -35,31 +40,112 @@ def build_parser() -> argparse.ArgumentParser:
         default=";",
         help="Delimiter for the generated CSV (default: ';' for Excel in FR locales)",
     )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--fast",
+        dest="safe",
+        action="store_false",
+        help="Swap delimiters on raw text blocks without parsing rows (default)",
+    )
+    mode.add_argument(
+        "--safe",
+        dest="safe",
+        action="store_true",
+        help="Parse and re-quote every row with the csv module (use if fields may contain quotes or the delimiter)",
+    )
+    # Both flags share dest="safe"; without this the store_false action's
+    # implicit True default would make --safe the default.
+    parser.set_defaults(safe=False)
+    parser.add_argument(
+        "--no-quote-scan",
+        action="store_true",
+        help=(
+            "With --safe, write fields unquoted (QUOTE_NONE) and backslash-escape any delimiter or quote "
+            "they contain; the writer still scans each field for those characters, and escaped "
+            "fields such as x\\;y are not read back correctly by Excel"
+        ),
+    )
     return parser
 
 
-def convert_file(src: Path, dest: Path, input_encoding: str, output_encoding: str, delimiter: str) -> None:
+def convert_file(
+    src: Path,
+    dest: Path,
+    input_encoding: str,
+    output_encoding: str,
+    delimiter: str,
+    safe: bool = False,
+    no_quote_scan: bool = False,
+) -> None:
     if not src.exists():
         raise FileNotFoundError(f"Input file not found: {src}")
 
     dest.parent.mkdir(parents=True, exist_ok=True)
 
+    if not safe:
+        _convert_fast(src, dest, input_encoding, output_encoding, delimiter)
+        return
+
+    # Trailing carriage returns only linger on Windows inputs; skip the per-field
+    # strip entirely when the start of the file has none.
+    with src.open("rb") as probe:
+        needs_strip = b"\r" in probe.read(CHUNK_SIZE)
+
     with src.open("r", encoding=input_encoding, newline="") as rfp, dest.open(
         "w", encoding=output_encoding, newline=""
     ) as wfp:
         reader = csv.reader(rfp, delimiter="|")
-        writer = csv.writer(wfp, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL)
+        if no_quote_scan:
+            # QUOTE_NONE drops the quoting but not the per-field scan: the
+            # writer still looks for the delimiter and quotechar to escape them.
+            writer = csv.writer(wfp, delimiter=delimiter, quoting=csv.QUOTE_NONE, escapechar="\\")
+        else:
+            writer = csv.writer(wfp, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL)
 
+        batch = []
         for row in reader:
-            # Strip trailing carriage returns that may linger on Windows inputs
-            cleaned = [field.rstrip("\r") for field in row]
-            writer.writerow(cleaned)
+            batch.append([field.rstrip("\r") for field in row] if needs_strip else row)
+            if len(batch) >= SAFE_BATCH_ROWS:
+                writer.writerows(batch)
+                batch.clear()
+        if batch:
+            writer.writerows(batch)
+
+
+def _convert_fast(src: Path, dest: Path, input_encoding: str, output_encoding: str, delimiter: str) -> None:
+    """Translate the dump block by block, relying on DGFiP fields never needing quotes.
+
+    Universal-newline reading folds ``\r\n``/``\r`` into ``\n`` and the writer
+    emits ``\r\n`` again, matching the csv module's line terminator.
+    """
+    with src.open("r", encoding=input_encoding, newline=None) as rfp, dest.open(
+        "w", encoding=output_encoding, newline="\r\n"
+    ) as wfp:
+        last = ""
+        while True:
+            chunk = rfp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            wfp.write(chunk.replace("|", delimiter))
+            last = chunk[-1]
+        if last and last != "\n":
+            wfp.write("\n")
 
 
 def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
-    convert_file(args.input, args.output, args.input_encoding, args.output_encoding, args.delimiter)
+    if args.no_quote_scan and not args.safe:
+        parser.error("--no-quote-scan only applies to --safe")
+    convert_file(
+        args.input,
+        args.output,
+        args.input_encoding,
+        args.output_encoding,
+        args.delimiter,
+        safe=args.safe,
+        no_quote_scan=args.no_quote_scan,
+    )
 
 
 if __name__ == "__main__":
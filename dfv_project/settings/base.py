@@ -79,11 +79,28 @@ def _default_sqlite_url() -> str:
 DATABASES = {
     "default": dj_database_url.config(
         default=_default_sqlite_url(),
-        conn_max_age=600,
+        conn_max_age=int(os.environ.get("DJANGO_DB_CONN_MAX_AGE", "600")),
         conn_health_checks=True,
     )
 }
 
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    # psycopg 3 only (ignored by psycopg2): bind parameters server-side so the
+    # server parses each statement shape once instead of per query.
+    if env_bool("DJANGO_DB_SERVER_SIDE_BINDING", False):
+        DATABASES["default"].setdefault("OPTIONS", {})["server_side_binding"] = True
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+
+# Lifetime of cached chart/map payloads. Imports invalidate them right away in
+# every process through the data version stored in the database.
+DVF_CACHE_TIMEOUT = int(os.environ.get("DVF_CACHE_TIMEOUT", "3600"))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
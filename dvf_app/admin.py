@@ -1,8 +1,50 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 
 from .models import CleanDVFRecord, Commune, Department
 
 
+class DepartmentCodeFilter(admin.SimpleListFilter):
+    """Department filter fed by the small Department table rather than a DISTINCT over communes."""
+
+    title = "department"
+    parameter_name = "department__code"
+
+    def lookups(self, request, model_admin):
+        codes = Department.objects.order_by("code").values_list("code", flat=True)
+        return [(code, code) for code in codes]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(department__code=self.value())
+        return queryset
+
+
+class CleanDVFRecordChangeList(ChangeList):
+    def get_queryset(self, request):
+        # The changelist only needs the displayed columns, the parts
+        # CleanDVFRecord.address() assembles and the commune codes the
+        # delete action's signal handlers read; skip the other columns. The
+        # change form keeps loading full rows through ModelAdmin.get_queryset.
+        return (
+            super()
+            .get_queryset(request)
+            .only(
+                "date_mutation",
+                "commune",
+                "valeur_fonciere",
+                "type_local",
+                "no_voie",
+                "btq",
+                "type_de_voie",
+                "voie",
+                "code_postal",
+                "code_departement",
+                "code_commune",
+            )
+        )
+
+
 @admin.register(CleanDVFRecord)
 class CleanDVFRecordAdmin(admin.ModelAdmin):
     list_display = ("date_mutation", "address", "commune", "valeur_fonciere", "type_local")
@@ -10,6 +52,9 @@ class CleanDVFRecordAdmin(admin.ModelAdmin):
     search_fields = ("commune", "voie", "code_postal", "code_voie", "identifiant_local")
     ordering = ("-date_mutation", "commune")
 
+    def get_changelist(self, request, **kwargs):
+        return CleanDVFRecordChangeList
+
 
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
@@ -30,5 +75,5 @@ class CommuneAdmin(admin.ModelAdmin):
         "updated_at",
     )
     search_fields = ("code_commune", "name", "department__code", "postal_codes")
-    list_filter = ("department__code",)
+    list_filter = (DepartmentCodeFilter,)
     ordering = ("name",)
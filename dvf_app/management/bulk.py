@@ -0,0 +1,275 @@
+"""Bulk-loading helpers shared by the import management commands."""
+
+from __future__ import annotations
+
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+import django
+from django.db import connection, connections, models, transaction
+
+COPY_CHUNK_ROWS = 50000
+# Size of the text blocks handed to COPY by copy_file.
+COPY_FILE_BLOCK_SIZE = 1 << 20
+# PostgreSQL's wire protocol limit on bind parameters per statement. Django 4.2
+# does not split bulk inserts for it, which matters with server-side binding.
+POSTGRES_MAX_QUERY_PARAMS = 65535
+
+
+def is_postgresql() -> bool:
+    return connection.vendor == "postgresql"
+
+
+def relax_commit_durability() -> None:
+    """Let the enclosing import transaction commit without waiting for the WAL flush.
+
+    Must be called inside ``transaction.atomic()``: ``SET LOCAL`` only lasts until
+    the transaction ends. A server crash right after the commit can lose the
+    import (rerun it), but never leaves it half applied.
+    """
+    if is_postgresql():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL synchronous_commit TO OFF")
+
+
+def bulk_batch_size(model: Type[models.Model], batch_size: int) -> int:
+    """Clamp ``batch_size`` so one multi-row INSERT for ``model`` stays under the parameter limit."""
+    if not is_postgresql():
+        return batch_size
+    return max(1, min(batch_size, POSTGRES_MAX_QUERY_PARAMS // len(model._meta.concrete_fields)))
+
+
+def _copy_sql(model: Type[models.Model], field_names: Sequence[str]) -> str:
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in field_names]
+    columns = ", ".join(quote(field.column) for field in fields)
+    # In CSV mode PostgreSQL reads unquoted empty values as NULL; keep them as
+    # empty strings for the NOT NULL (blank CharField) columns.
+    not_null = ", ".join(quote(field.column) for field in fields if not field.null)
+    options = "FORMAT csv"
+    if not_null:
+        options += f", FORCE_NOT_NULL ({not_null})"
+    return f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN WITH ({options})"
+
+
+def copy_rows(
+    model: Type[models.Model],
+    field_names: Sequence[str],
+    rows: Iterable[Sequence[object]],
+    chunk_rows: int = COPY_CHUNK_ROWS,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Stream ``rows`` into ``model``'s table with PostgreSQL ``COPY FROM STDIN``.
+
+    Values are written in ``field_names`` order; ``None`` becomes NULL. Returns
+    the number of rows copied.
+    """
+    sql = _copy_sql(model, field_names)
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, "copy"):
+            # psycopg 3: keep a single COPY open and feed it chunk by chunk.
+            with raw.copy(sql) as copy:
+                pending = 0
+                for row in rows:
+                    writer.writerow(row)
+                    pending += 1
+                    if pending >= chunk_rows:
+                        copy.write(buffer.getvalue())
+                        buffer.seek(0)
+                        buffer.truncate()
+                        total += pending
+                        pending = 0
+                        if progress:
+                            progress(total)
+                if pending:
+                    copy.write(buffer.getvalue())
+                    total += pending
+        else:
+            # psycopg2: one copy_expert call per chunk.
+            pending = 0
+            for row in rows:
+                writer.writerow(row)
+                pending += 1
+                if pending >= chunk_rows:
+                    buffer.seek(0)
+                    raw.copy_expert(sql, buffer)
+                    buffer.seek(0)
+                    buffer.truncate()
+                    total += pending
+                    pending = 0
+                    if progress:
+                        progress(total)
+            if pending:
+                buffer.seek(0)
+                raw.copy_expert(sql, buffer)
+                total += pending
+    return total
+
+
+def copy_file(model: Type[models.Model], path: Path, encoding: str = "utf-8") -> int:
+    """Load a CSV file whose header names ``model`` fields with ``COPY FROM STDIN``.
+
+    The file is streamed to the server as-is, so values must already be in
+    PostgreSQL's input format (ISO dates, ``.`` decimals, no padding). Empty
+    values become NULL for nullable columns and ``''`` otherwise. Returns the
+    number of rows copied.
+    """
+    with path.open("r", encoding=encoding, newline="") as fp:
+        header = next(csv.reader([fp.readline()]), [])
+        sql = _copy_sql(model, header)
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, "copy"):
+                with raw.copy(sql) as copy:
+                    while block := fp.read(COPY_FILE_BLOCK_SIZE):
+                        copy.write(block)
+            else:
+                raw.copy_expert(sql, fp, size=COPY_FILE_BLOCK_SIZE)
+            return raw.rowcount
+
+
+class _FileRange(io.RawIOBase):
+    """Read-only view of the bytes ``[start, end)`` of an open binary file."""
+
+    def __init__(self, fp, start: int, end: int):
+        fp.seek(start)
+        self._fp = fp
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fp.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+def _split_file(path: Path, parts: int) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """Return the header line and up to ``parts`` byte ranges that start and end on line breaks."""
+    size = path.stat().st_size
+    with path.open("rb") as fp:
+        header = fp.readline()
+        boundaries = [fp.tell()]
+        for part in range(1, parts):
+            fp.seek(max(boundaries[-1], size * part // parts))
+            fp.readline()
+            boundaries.append(min(fp.tell(), size))
+        boundaries.append(size)
+    ranges = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return header, ranges
+
+
+def _copy_file_range(path: str, sql: str, start: int, end: int) -> int:
+    """Worker for copy_file_parallel: COPY one slice of the file over its own connection."""
+    try:
+        with transaction.atomic(), open(path, "rb") as fp:
+            relax_commit_durability()
+            with connection.cursor() as cursor:
+                raw = cursor.cursor
+                chunk = _FileRange(fp, start, end)
+                if hasattr(raw, "copy"):
+                    with raw.copy(sql) as copy:
+                        while block := chunk.read(COPY_FILE_BLOCK_SIZE):
+                            copy.write(block)
+                else:
+                    raw.copy_expert(sql, chunk, size=COPY_FILE_BLOCK_SIZE)
+                return raw.rowcount
+    finally:
+        connections.close_all()
+
+
+def copy_file_parallel(model: Type[models.Model], path: Path, workers: int) -> int:
+    """Like copy_file, but COPY byte slices of the file from ``workers`` processes at once.
+
+    PostgreSQL parses COPY input in the receiving backend, so one connection
+    per slice spreads that work over several server cores. Each worker commits
+    its own slice: call this outside ``transaction.atomic()`` (the workers
+    cannot see, and would wait on, uncommitted changes to the table) and
+    expect a partial load if one of them fails. The slices are sent as raw
+    bytes split on line breaks, so the file must be UTF-8 and quoted values
+    must not contain newlines.
+    """
+    header, ranges = _split_file(path, workers)
+    sql = _copy_sql(model, next(csv.reader([header.decode("utf-8")]), []))
+    if len(ranges) <= 1:
+        return copy_file(model, path)
+    # Forked children must not share the parent's socket.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=len(ranges), initializer=django.setup) as executor:
+        futures = [
+            executor.submit(_copy_file_range, str(path), sql, start, end)
+            for start, end in ranges
+        ]
+        return sum(future.result() for future in futures)
+
+
+def truncate(*model_classes: Type[models.Model]) -> None:
+    """Empty the given tables with raw SQL, bypassing the ORM's collector and signals.
+
+    PostgreSQL gets a single TRUNCATE; other backends get one DELETE per table in
+    the order given, so list referencing tables before the tables they point to.
+    """
+    if not is_postgresql():
+        delete_all(*model_classes)
+        return
+    quote = connection.ops.quote_name
+    tables = ", ".join(quote(model._meta.db_table) for model in model_classes)
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+
+
+def delete_all(*model_classes: Type[models.Model]) -> None:
+    """Empty the given tables with one raw DELETE each, bypassing the ORM's collector and signals.
+
+    Unlike TRUNCATE, which holds an ACCESS EXCLUSIVE lock until the transaction
+    ends, DELETE only locks rows: inside a long import transaction, readers keep
+    seeing the old rows until it commits. List referencing tables first.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in model_classes:
+            cursor.execute(f"DELETE FROM {quote(model._meta.db_table)}")
+
+
+@contextmanager
+def indexes_deferred(*model_classes: Type[models.Model]) -> Iterator[None]:
+    """Drop the models' ``Meta.indexes`` for the duration of a bulk load, then rebuild them.
+
+    Building an index once over the loaded table is much cheaper than updating
+    it row by row. Use outside ``transaction.atomic()``: SQLite cannot alter its
+    schema inside one. The indexes are rebuilt even if the load fails.
+    """
+    dropped = []
+    with connection.cursor() as cursor:
+        for model in model_classes:
+            existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            dropped.extend((model, index) for index in model._meta.indexes if index.name in existing)
+    with connection.schema_editor() as editor:
+        for model, index in dropped:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model, index in dropped:
+                editor.add_index(model, index)
+
+
+def analyze(*model_classes: Type[models.Model]) -> None:
+    """Refresh planner statistics after a bulk load (outside any transaction on PostgreSQL)."""
+    command = "VACUUM ANALYZE" if is_postgresql() else "ANALYZE"
+    with connection.cursor() as cursor:
+        for model in model_classes:
+            cursor.execute(f"{command} {connection.ops.quote_name(model._meta.db_table)}")
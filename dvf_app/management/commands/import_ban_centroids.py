@@ -3,55 +3,88 @@ from __future__ import annotations
 import csv
 import gzip
 import io
+import math
 import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from typing import Dict, Iterable, Optional, Set
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
+from dvf_app.management import bulk
 from dvf_app.models import Commune, Department
+from dvf_app.services.cache import bump_data_version
 
-BASE_URL = "https://adresse.data.gouv.fr/data/ban/adresses/latest/csv"
-DEPARTMENT_META_URL = "https://geo.api.gouv.fr/departements"
-
+try:  # orjson decodes straight from bytes and is much faster than the stdlib.
+    import orjson
 
-def _extract_department_code(code_insee: str) -> Optional[str]:
-    code_insee = (code_insee or "").strip()
-    if not code_insee:
-        return None
-    if code_insee.startswith(("97", "98")):
-        return code_insee[:3]
-    return code_insee[:2]
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover - optional dependency
+    import json
 
+    _json_loads = json.loads
 
-@dataclass
+BASE_URL = "https://adresse.data.gouv.fr/data/ban/adresses/latest/csv"
+DEPARTMENT_META_URL = "https://geo.api.gouv.fr/departements"
+# Read the compressed HTTP stream in large blocks so gzip and the CSV parser are
+# not starved by the small default socket reads.
+DOWNLOAD_BUFFER_SIZE = 1 << 20
+
+
+def _build_session(pool_size: int, retries: int) -> requests.Session:
+    """HTTP session reusing keep-alive connections, with retries on gateway errors.
+
+    Connection failures are retried at most once: without network access the
+    full backoff schedule would only delay the error by several seconds.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=retries,
+            connect=min(retries, 1),
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@dataclass(slots=True)
 class AreaAccumulator:
     name: str = ""
     department_code: Optional[str] = None
     lon_sum: float = 0.0
     lat_sum: float = 0.0
     count: int = 0
-    min_lon: Optional[float] = None
-    min_lat: Optional[float] = None
-    max_lon: Optional[float] = None
-    max_lat: Optional[float] = None
+    # Infinite sentinels let the per-address update skip "is None" checks;
+    # bounding_box() still reports None for an empty accumulator.
+    min_lon: float = math.inf
+    min_lat: float = math.inf
+    max_lon: float = -math.inf
+    max_lat: float = -math.inf
     postal_codes: Set[str] = field(default_factory=set)
 
-    def add(self, *, lon: float, lat: float, postal_code: Optional[str] = None, name: Optional[str] = None) -> None:
+    def add(self, lon: float, lat: float, postal_code: Optional[str] = None, name: Optional[str] = None) -> None:
         self.lon_sum += lon
         self.lat_sum += lat
         self.count += 1
 
-        if self.min_lon is None or lon < self.min_lon:
+        if lon < self.min_lon:
             self.min_lon = lon
-        if self.max_lon is None or lon > self.max_lon:
+        if lon > self.max_lon:
             self.max_lon = lon
-        if self.min_lat is None or lat < self.min_lat:
+        if lat < self.min_lat:
             self.min_lat = lat
-        if self.max_lat is None or lat > self.max_lat:
+        if lat > self.max_lat:
             self.max_lat = lat
 
         if postal_code:
@@ -59,12 +92,29 @@ class AreaAccumulator:
         if name and not self.name:
             self.name = name
 
+    def merge(self, other: "AreaAccumulator") -> None:
+        """Fold another accumulator's totals and extent into this one."""
+        self.lon_sum += other.lon_sum
+        self.lat_sum += other.lat_sum
+        self.count += other.count
+
+        if other.min_lon < self.min_lon:
+            self.min_lon = other.min_lon
+        if other.max_lon > self.max_lon:
+            self.max_lon = other.max_lon
+        if other.min_lat < self.min_lat:
+            self.min_lat = other.min_lat
+        if other.max_lat > self.max_lat:
+            self.max_lat = other.max_lat
+
     def centroid(self) -> tuple[Optional[float], Optional[float]]:
         if not self.count:
             return None, None
         return self.lon_sum / self.count, self.lat_sum / self.count
 
     def bounding_box(self) -> tuple[Optional[float], Optional[float], Optional[float], Optional[float]]:
+        if not self.count:
+            return None, None, None, None
         return self.min_lon, self.min_lat, self.max_lon, self.max_lat
 
 
@@ -85,11 +135,39 @@ class Command(BaseCommand):
             default=BASE_URL,
             help="Override the BAN CSV base URL (defaults to the latest official release).",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Number of department files to download and parse concurrently.",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=5,
+            help="Retries per HTTP request on gateway errors (connection failures are retried once).",
+        )
 
     def handle(self, *args, **options):
         departments: Optional[Iterable[str]] = options.get("departments")
         base_url: str = options["base_url"].rstrip("/")
+        workers: int = options["workers"]
+        retries: int = options["retries"]
+
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+        if retries < 0:
+            raise CommandError("--retries cannot be negative.")
+
+        # One pooled session for every request, sized so each worker keeps its
+        # own keep-alive connection.
+        self.session = _build_session(workers, retries)
+        try:
+            self._run(departments, base_url, workers)
+        finally:
+            self.session.close()
 
+    def _run(self, departments: Optional[Iterable[str]], base_url: str, workers: int) -> None:
         if departments:
             codes = {code.strip() for code in departments if code.strip()}
         else:
@@ -101,71 +179,43 @@ class Command(BaseCommand):
 
 
         commune_stats: Dict[str, AreaAccumulator] = {}
-        department_stats: Dict[str, AreaAccumulator] = defaultdict(AreaAccumulator)
-        department_communes: Dict[str, Set[str]] = defaultdict(set)
 
-        for code in sorted(codes):
-            url = f"{base_url}/adresses-{code}.csv.gz"
-            self.stdout.write(f"Downloading {url}...")
+        # Department files are independent: download and parse them concurrently
+        # (network waits and gzip release the GIL), then fold the results in code
+        # order so the aggregation stays deterministic.
+        ordered_codes = sorted(codes)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._process_department, code, base_url)
+                for code in ordered_codes
+            ]
             try:
-                resp = requests.get(url, stream=True, timeout=120)
-                resp.raise_for_status()
-            except requests.RequestException as exc:
-                raise CommandError(f"Failed to download {url}: {exc}") from exc
-
-            resp.raw.decode_content = True
-            processed = 0
-            skipped = 0
-
-            with gzip.GzipFile(fileobj=resp.raw) as gz:
-                reader = csv.DictReader(
-                    io.TextIOWrapper(gz, encoding="utf-8", newline=""),
-                    delimiter=";",
-                )
-                for row in reader:
-                    code_insee = (row.get("code_insee") or "").strip()
-                    lon_raw = row.get("lon")
-                    lat_raw = row.get("lat")
-                    if not code_insee or not lon_raw or not lat_raw:
-                        skipped += 1
-                        continue
-
-                    dept_code = _extract_department_code(code_insee)
-                    if not dept_code:
-                        skipped += 1
-                        continue
-
-                    try:
-                        lon = float(lon_raw)
-                        lat = float(lat_raw)
-                    except ValueError:
-                        skipped += 1
-                        continue
-
-                    commune_name = (row.get("nom_commune") or "").strip()
-                    postal_code = (row.get("code_postal") or "").strip()
-
-                    commune_entry = commune_stats.setdefault(
-                        code_insee,
-                        AreaAccumulator(name=commune_name, department_code=dept_code),
+                for code, future in zip(ordered_codes, futures):
+                    file_communes, processed, skipped = future.result()
+                    for code_insee, acc in file_communes.items():
+                        existing = commune_stats.get(code_insee)
+                        if existing is None:
+                            commune_stats[code_insee] = acc
+                            continue
+                        existing.merge(acc)
+                        existing.postal_codes |= acc.postal_codes
+                        if not existing.name:
+                            existing.name = acc.name
+                    self.stdout.write(
+                        f"  {code}: processed {processed:,} addresses, skipped {skipped:,} rows."
                     )
-                    if commune_name and not commune_entry.name:
-                        commune_entry.name = commune_name
-                    commune_entry.department_code = dept_code
-                    commune_entry.add(lon=lon, lat=lat, postal_code=postal_code, name=commune_name)
-
-                    dept_entry = department_stats[dept_code]
-                    dept_entry.department_code = dept_code
-                    dept_entry.add(lon=lon, lat=lat)
-                    department_communes[dept_code].add(code_insee)
-
-                    processed += 1
-                    if processed and processed % 500000 == 0:
-                        self.stdout.write(f"  {code}: processed {processed:,} addresses", ending="\r")
-
-            self.stdout.write(
-                f"  {code}: processed {processed:,} addresses, skipped {skipped:,} rows."
-            )
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        # Department totals are derived from the commune totals rather than being
+        # updated alongside them for every address row.
+        department_stats: Dict[str, AreaAccumulator] = defaultdict(AreaAccumulator)
+        department_communes: Dict[str, int] = defaultdict(int)
+        for acc in commune_stats.values():
+            department_stats[acc.department_code].merge(acc)
+            department_communes[acc.department_code] += 1
 
         self.stdout.write(
             f"Aggregated {len(commune_stats):,} communes across {len(department_stats):,} departments."
@@ -201,20 +251,106 @@ class Command(BaseCommand):
                 "min_lat": min_lat,
                 "max_lon": max_lon,
                 "max_lat": max_lat,
-                "commune_count": len(department_communes.get(dept_code, set())),
+                "commune_count": department_communes.get(dept_code, 0),
             }
 
         self._persist(communes_payload, departments_payload)
+        bump_data_version()
         self.stdout.write(self.style.SUCCESS("BAN centroid import completed."))
 
+    def _process_department(
+        self, code: str, base_url: str
+    ) -> tuple[Dict[str, AreaAccumulator], int, int]:
+        """Download one department file and accumulate its communes."""
+        url = f"{base_url}/adresses-{code}.csv.gz"
+        self.stdout.write(f"Downloading {url}...")
+        try:
+            # The context manager hands the pooled connection back even when
+            # parsing fails half-way through the stream.
+            with self.session.get(url, stream=True, timeout=120) as resp:
+                resp.raise_for_status()
+                return self._accumulate_communes(resp, code, url)
+        except requests.RequestException as exc:
+            raise CommandError(f"Failed to download {url}: {exc}") from exc
+
+    def _accumulate_communes(
+        self, resp: requests.Response, code: str, url: str
+    ) -> tuple[Dict[str, AreaAccumulator], int, int]:
+        commune_stats: Dict[str, AreaAccumulator] = {}
+        resp.raw.decode_content = True
+        # Keep urllib3 from closing the stream at EOF under the buffered reader.
+        resp.raw.auto_close = False
+        processed = 0
+        skipped = 0
+
+        raw = io.BufferedReader(resp.raw, buffer_size=DOWNLOAD_BUFFER_SIZE)
+        with gzip.GzipFile(fileobj=raw) as gz:
+            reader = csv.reader(
+                io.TextIOWrapper(
+                    io.BufferedReader(gz, buffer_size=DOWNLOAD_BUFFER_SIZE),
+                    encoding="utf-8",
+                    newline="",
+                ),
+                delimiter=";",
+            )
+            header = next(reader, [])
+            missing = [col for col in ("code_insee", "lon", "lat") if col not in header]
+            if missing:
+                raise CommandError(f"{url} is missing expected columns: {', '.join(missing)}")
+
+            # Resolve column positions once; rows are then read positionally
+            # instead of through a dict built for every address.
+            idx_code = header.index("code_insee")
+            idx_lon = header.index("lon")
+            idx_lat = header.index("lat")
+            idx_nom = header.index("nom_commune") if "nom_commune" in header else None
+            idx_cp = header.index("code_postal") if "code_postal" in header else None
+            width = max(idx for idx in (idx_code, idx_lon, idx_lat, idx_nom, idx_cp) if idx is not None) + 1
+
+            for row in reader:
+                if len(row) < width:
+                    row += [""] * (width - len(row))
+                code_insee = row[idx_code].strip()
+                lon_raw = row[idx_lon]
+                lat_raw = row[idx_lat]
+                if not code_insee or not lon_raw or not lat_raw:
+                    skipped += 1
+                    continue
+
+                try:
+                    lon = float(lon_raw)
+                    lat = float(lat_raw)
+                except ValueError:
+                    skipped += 1
+                    continue
+
+                commune_name = row[idx_nom].strip() if idx_nom is not None else ""
+                postal_code = row[idx_cp].strip() if idx_cp is not None else ""
+
+                commune_entry = commune_stats.get(code_insee)
+                if commune_entry is None:
+                    # code_insee is already stripped and non-empty here; overseas
+                    # departments (97x/98x) use a three-character code.
+                    prefix = code_insee[:2]
+                    commune_entry = commune_stats[code_insee] = AreaAccumulator(
+                        department_code=code_insee[:3] if prefix in ("97", "98") else prefix,
+                    )
+                commune_entry.add(lon, lat, postal_code, commune_name)
+
+                processed += 1
+                if processed and processed % 500000 == 0:
+                    self.stdout.write(f"  {code}: processed {processed:,} addresses", ending="\r")
+
+        return commune_stats, processed, skipped
+
     def _fetch_department_names(self) -> Dict[str, str]:
         try:
-            resp = requests.get(DEPARTMENT_META_URL, timeout=60)
+            resp = self.session.get(DEPARTMENT_META_URL, timeout=60)
             resp.raise_for_status()
         except requests.RequestException:
             return {}
         try:
-            data = resp.json()
+            data = _json_loads(resp.content)
         except ValueError:
             return {}
         mapping = {}
@@ -227,21 +363,24 @@ class Command(BaseCommand):
         return mapping
 
     def _discover_department_codes(self, base_url: str) -> Set[str]:
+        pattern = re.compile(rb"adresses-([0-9A-Z]{2,3})\.csv\.gz")
+        codes: Set[str] = set()
         try:
-            resp = requests.get(base_url + "/", timeout=60)
-            resp.raise_for_status()
+            # Scan the listing line by line as it arrives rather than decoding
+            # the whole page and regex-searching one large string.
+            with self.session.get(base_url + "/", stream=True, timeout=60) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    codes.update(match.decode("ascii") for match in pattern.findall(line))
         except requests.RequestException as exc:
             raise CommandError(f"Failed to list BAN directory {base_url}/: {exc}") from exc
-
-        pattern = re.compile(r"adresses-([0-9A-Z]{2,3})\.csv\.gz")
-        codes = set(pattern.findall(resp.text))
         return codes
 
     @staticmethod
     @transaction.atomic
     def _persist(communes: Dict[str, dict], departments: Dict[str, dict]) -> None:
-        Commune.objects.all().delete()
-        Department.objects.all().delete()
+        bulk.relax_commit_durability()
+        bulk.truncate(Commune, Department)
 
         department_models = [
             Department(
@@ -259,19 +398,21 @@ class Command(BaseCommand):
             for code, data in departments.items()
         ]
 
-        Department.objects.bulk_create(department_models, batch_size=500)
-        department_map = {dept.code: dept for dept in Department.objects.all()}
+        created = Department.objects.bulk_create(department_models)
+        department_ids = {dept.code: dept.pk for dept in created}
+        if None in department_ids.values():
+            # Backends without INSERT ... RETURNING don't populate primary keys.
+            department_ids = dict(Department.objects.values_list("code", "id"))
 
         commune_models = []
         for code, data in communes.items():
-            department_code = data.get("department_code")
-            department = department_map.get(department_code)
-            if department is None:
+            department_id = department_ids.get(data.get("department_code"))
+            if department_id is None:
                 continue
             commune_models.append(
                 Commune(
                     code_commune=code,
-                    department=department,
+                    department_id=department_id,
                     name=data.get("name", code),
                     centroid_lon=data.get("centroid_lon"),
                     centroid_lat=data.get("centroid_lat"),
@@ -284,7 +425,7 @@ class Command(BaseCommand):
                 )
             )
 
-        Commune.objects.bulk_create(commune_models, batch_size=1000)
+        Commune.objects.bulk_create(commune_models, batch_size=5000)
 
 
 
@@ -1,14 +1,97 @@
 import csv
+import os
+from itertools import islice
 
-
+from datetime import date
 from decimal import Decimal
 from pathlib import Path
+from typing import Iterator, Optional
 
+from django.core.exceptions import FieldDoesNotExist
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.utils.dateparse import parse_date
 
-from dvf_app.models import CleanDVFRecord, Commune, Department
+from dvf_app.management import bulk
+from dvf_app.models import CleanDVFRecord, Commune, Department, DVFMonthlyAgg
+from dvf_app.services.aggregates import fill_mutation_months, rebuild_monthly_aggregates
+from dvf_app.services.cache import bump_data_version
+
+
+def _parse_float(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    return float(value)
+
+
+def _parse_int(value: Optional[str], allow_zero: bool = False) -> Optional[int]:
+    if value is None:
+        return None
+    value = value.strip()
+    if not value:
+        return 0 if allow_zero else None
+    return int(value)
+
+
+def _parse_decimal(value: Optional[str]) -> Optional[Decimal]:
+    if value is None:
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    return Decimal(value)
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    if value is None:
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    # Dumps hold ISO dates; the C parser skips parse_date's regex match, which
+    # stays as the fallback for anything it rejects (e.g. unpadded months).
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return parse_date(value)
+
+
+# CleanDVFRecord columns read by the chart and heatmap services; --lean leaves
+# the others (address, cadastre, lots, culture) empty.
+LEAN_FIELDS = (
+    "date_mutation",
+    "nature_mutation",
+    "valeur_fonciere",
+    "code_departement",
+    "code_commune",
+    "type_local",
+    "surface_reelle_bati",
+    "surface_terrain",
+)
+
+
+# Batch-size options: (option dest, environment variable, default).
+BATCH_SIZE_OPTIONS = (
+    ("dept_batch", "DVF_DEPT_BATCH_SIZE", 1000),
+    ("commune_batch", "DVF_COMMUNE_BATCH_SIZE", 5000),
+    ("batch_size", "DVF_CLEAN_BATCH_SIZE", 5000),
+)
+
+
+def _env_batch_size(name: str, default: int) -> int:
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise CommandError(f"{name} must be an integer, got {raw!r}") from None
+    if value <= 0:
+        raise CommandError(f"{name} must be a positive integer, got {raw!r}")
+    return value
 
 
 class Command(BaseCommand):
@@ -23,16 +106,65 @@ class Command(BaseCommand):
         parser.add_argument(
             "--force",
             action="store_true",
-            help="Re-import data even if tables already contain rows (will wipe tables first)",
+            help=(
+                "Re-import data even if tables already contain rows (will wipe tables first); "
+                "the old rows stay readable until the import commits, except with --workers > 1, "
+                "where CleanDVFRecord stays empty until the parallel COPY finishes"
+            ),
+        )
+        # Larger batches mean fewer INSERT statements to parse; the backend still
+        # caps each statement at its parameter limit (999 on older SQLite).
+        parser.add_argument(
+            "--dept-batch",
+            type=int,
+            help="Department rows per bulk create (default: DVF_DEPT_BATCH_SIZE or 1000)",
         )
         parser.add_argument(
+            "--commune-batch",
+            type=int,
+            help="Commune rows per bulk create (default: DVF_COMMUNE_BATCH_SIZE or 5000)",
+        )
+        parser.add_argument(
+            "--clean-batch",
             "--batch-size",
+            dest="batch_size",
+            type=int,
+            help="CleanDVFRecord rows per bulk create (default: DVF_CLEAN_BATCH_SIZE or 5000)",
+        )
+        parser.add_argument(
+            "--use-copy",
+            action="store_true",
+            help="On PostgreSQL, stream CleanDVFRecord.csv straight into the table with COPY",
+        )
+        parser.add_argument(
+            "--rebuild-indexes",
+            action="store_true",
+            help="Drop CleanDVFRecord indexes during the load, rebuild them and ANALYZE afterwards (needs DDL rights)",
+        )
+        parser.add_argument(
+            "--workers",
             type=int,
-            default=2000,
-            help="Number of CleanDVFRecord rows to insert per bulk create",
+            default=1,
+            help=(
+                "With --use-copy, COPY CleanDVFRecord.csv in this many parallel slices; "
+                "the records are then committed separately from the other tables"
+            ),
+        )
+        parser.add_argument(
+            "--lean",
+            action="store_true",
+            help="Only load the CleanDVFRecord columns the charts use; address and cadastral columns stay empty",
         )
 
     def handle(self, *args, **options):
+        # The environment fallbacks are read here rather than in add_arguments
+        # so a bad value cannot break --help.
+        for dest, env_name, default in BATCH_SIZE_OPTIONS:
+            if options[dest] is None:
+                options[dest] = _env_batch_size(env_name, default)
+            elif options[dest] <= 0:
+                raise CommandError(f"--{dest.replace('_', '-')} must be a positive integer")
+
         base_path = Path(options["base_path"]).resolve()
         if not base_path.exists():
             raise CommandError(f"Dump directory not found: {base_path}")
@@ -45,31 +177,68 @@ class Command(BaseCommand):
             if not file_path.exists():
                 raise CommandError(f"Required dump file missing: {file_path}")
 
-        if options["force"]:
-            self.stdout.write(self.style.WARNING("Force option enabled: clearing existing data"))
-            self._clear_tables()
-        else:
-            if Department.objects.exists() or Commune.objects.exists() or CleanDVFRecord.objects.exists():
-                self.stdout.write(
-                    self.style.WARNING(
-                        "Existing data detected. Skipping import. Use --force to overwrite existing rows."
-                    )
+        if not options["force"] and (
+            Department.objects.exists() or Commune.objects.exists() or CleanDVFRecord.objects.exists()
+        ):
+            self.stdout.write(
+                self.style.WARNING(
+                    "Existing data detected. Skipping import. Use --force to overwrite existing rows."
                 )
-                return
+            )
+            return
 
-        self._import_departments(department_file)
-        self._import_communes(commune_file)
-        self._import_clean_records(clean_file, batch_size=options["batch_size"])
+        if options["rebuild_indexes"]:
+            with bulk.indexes_deferred(CleanDVFRecord):
+                self._load(department_file, commune_file, clean_file, options)
+            bulk.analyze(Department, Commune, CleanDVFRecord, DVFMonthlyAgg)
+        else:
+            self._load(department_file, commune_file, clean_file, options)
+        bump_data_version()
 
         self.stdout.write(self.style.SUCCESS("Import completed successfully"))
 
-    def _clear_tables(self):
+    def _load(self, department_file: Path, commune_file: Path, clean_file: Path, options):
+        use_copy = options["use_copy"] and bulk.is_postgresql()
+        if options["use_copy"] and not use_copy:
+            self.stdout.write(self.style.WARNING("--use-copy requires PostgreSQL; using bulk inserts"))
+        parallel = use_copy and options["workers"] > 1
+        if parallel and options["lean"]:
+            self.stdout.write(self.style.WARNING("--workers does not apply to --lean; using one connection"))
+            parallel = False
+
+        # One transaction for the whole load: a single commit instead of one per
+        # batch, and a failed import leaves the previous data in place.
         with transaction.atomic():
-            CleanDVFRecord.objects.all().delete()
-            Commune.objects.all().delete()
-            Department.objects.all().delete()
+            bulk.relax_commit_durability()
+            if options["force"]:
+                self.stdout.write(self.style.WARNING("Force option enabled: clearing existing data"))
+                # DELETE rather than TRUNCATE: the site keeps serving the old
+                # rows while the load runs instead of blocking on a table lock.
+                # A parallel COPY commits this first, so the records table is
+                # empty until the slices land.
+                bulk.delete_all(CleanDVFRecord, Commune, Department)
+
+            self._import_departments(department_file, batch_size=options["dept_batch"])
+            self._import_communes(commune_file, batch_size=options["commune_batch"])
+            if not parallel:
+                if use_copy:
+                    self._copy_clean_records(clean_file, lean=options["lean"])
+                else:
+                    self._import_clean_records(clean_file, batch_size=options["batch_size"], lean=options["lean"])
+                self._rebuild_summary()
 
-    def _import_departments(self, path: Path):
+        if parallel:
+            # The worker connections cannot see this transaction, so they run
+            # after it commits and each commits its own slice.
+            self._copy_clean_records(clean_file, workers=options["workers"])
+            with transaction.atomic():
+                self._rebuild_summary()
+
+    def _rebuild_summary(self):
+        summary_rows = rebuild_monthly_aggregates()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {summary_rows} monthly aggregate rows"))
+
+    def _import_departments(self, path: Path, batch_size: int):
         self.stdout.write("Importing departments...")
         departments = []
         with path.open("r", encoding="utf-8", newline="") as fp:
@@ -79,128 +248,137 @@ class Command(BaseCommand):
                     Department(
                         code=row["code"].strip(),
                         name=row["name"].strip(),
-                        centroid_lon=self._parse_float(row.get("centroid_lon")),
-                        centroid_lat=self._parse_float(row.get("centroid_lat")),
-                        address_count=self._parse_int(row.get("address_count"), allow_zero=True) or 0,
-                        commune_count=self._parse_int(row.get("commune_count"), allow_zero=True) or 0,
-                        min_lon=self._parse_float(row.get("min_lon")),
-                        min_lat=self._parse_float(row.get("min_lat")),
-                        max_lon=self._parse_float(row.get("max_lon")),
-                        max_lat=self._parse_float(row.get("max_lat")),
+                        centroid_lon=_parse_float(row.get("centroid_lon")),
+                        centroid_lat=_parse_float(row.get("centroid_lat")),
+                        address_count=_parse_int(row.get("address_count"), allow_zero=True) or 0,
+                        commune_count=_parse_int(row.get("commune_count"), allow_zero=True) or 0,
+                        min_lon=_parse_float(row.get("min_lon")),
+                        min_lat=_parse_float(row.get("min_lat")),
+                        max_lon=_parse_float(row.get("max_lon")),
+                        max_lat=_parse_float(row.get("max_lat")),
                     )
                 )
-        Department.objects.bulk_create(departments, batch_size=1000)
+        Department.objects.bulk_create(departments, batch_size=bulk.bulk_batch_size(Department, batch_size))
         self.stdout.write(self.style.SUCCESS(f"Imported {len(departments)} departments"))
 
-    def _import_communes(self, path: Path):
+    def _import_communes(self, path: Path, batch_size: int):
         self.stdout.write("Importing communes...")
-        department_map = {dept.code: dept for dept in Department.objects.all()}
+        # Only the primary keys are needed to set the foreign key.
+        department_ids = dict(Department.objects.values_list("code", "id"))
         communes = []
         skipped = 0
         with path.open("r", encoding="utf-8", newline="") as fp:
             reader = csv.DictReader(fp)
             for row in reader:
                 department_code = row["department_code"].strip()
-                department = department_map.get(department_code)
-                if not department:
+                department_id = department_ids.get(department_code)
+                if department_id is None:
                     skipped += 1
                     continue
                 communes.append(
                     Commune(
                         code_commune=row["code_commune"].strip(),
-                        department=department,
+                        department_id=department_id,
                         name=row["name"].strip(),
-                        centroid_lon=self._parse_float(row.get("centroid_lon")),
-                        centroid_lat=self._parse_float(row.get("centroid_lat")),
-                        address_count=self._parse_int(row.get("address_count"), allow_zero=True) or 0,
+                        centroid_lon=_parse_float(row.get("centroid_lon")),
+                        centroid_lat=_parse_float(row.get("centroid_lat")),
+                        address_count=_parse_int(row.get("address_count"), allow_zero=True) or 0,
                         postal_codes=row.get("postal_codes", "").strip(),
-                        min_lon=self._parse_float(row.get("min_lon")),
-                        min_lat=self._parse_float(row.get("min_lat")),
-                        max_lon=self._parse_float(row.get("max_lon")),
-                        max_lat=self._parse_float(row.get("max_lat")),
+                        min_lon=_parse_float(row.get("min_lon")),
+                        min_lat=_parse_float(row.get("min_lat")),
+                        max_lon=_parse_float(row.get("max_lon")),
+                        max_lat=_parse_float(row.get("max_lat")),
                     )
                 )
-        Commune.objects.bulk_create(communes, batch_size=1000)
+        Commune.objects.bulk_create(communes, batch_size=bulk.bulk_batch_size(Commune, batch_size))
         self.stdout.write(
             self.style.SUCCESS(
                 f"Imported {len(communes)} communes" + (f" (skipped {skipped} without department)" if skipped else "")
             )
         )
 
-    def _import_clean_records(self, path: Path, batch_size: int):
+    def _import_clean_records(self, path: Path, batch_size: int, lean: bool = False):
         self.stdout.write("Importing CleanDVFRecord dataset...")
-        records_to_create = []
+        batch_size = bulk.bulk_batch_size(CleanDVFRecord, batch_size)
         inserted = 0
+        # Only one batch of model instances is alive at a time.
+        records = self._iter_clean_records(path, lean=lean)
+        while batch := list(islice(records, batch_size)):
+            CleanDVFRecord.objects.bulk_create(batch, batch_size=batch_size)
+            inserted += len(batch)
+            self.stdout.write(f"  Inserted {inserted} rows...")
+        self.stdout.write(self.style.SUCCESS(f"Imported {inserted} CleanDVFRecord rows"))
+
+    def _iter_clean_records(self, path: Path, lean: bool = False) -> Iterator[CleanDVFRecord]:
         with path.open("r", encoding="utf-8", newline="") as fp:
-            reader = csv.DictReader(fp)
+            reader = csv.reader(fp)
+            header = next(reader, [])
+            # Columns absent from the dump (or skipped by --lean) point one past
+            # the header, a cell every padded row leaves empty.
+            width = len(header)
+            idx = {
+                field.name: header.index(field.name)
+                if field.name in header and (not lean or field.name in LEAN_FIELDS)
+                else width
+                for field in CleanDVFRecord._meta.concrete_fields
+            }
             for row in reader:
-                records_to_create.append(
-                    CleanDVFRecord(
-                        date_mutation=self._parse_date(row.get("date_mutation")),
-                        nature_mutation=row.get("nature_mutation", "").strip(),
-                        valeur_fonciere=self._parse_decimal(row.get("valeur_fonciere")),
-                        no_voie=row.get("no_voie", "").strip(),
-                        btq=row.get("btq", "").strip(),
-                        type_de_voie=row.get("type_de_voie", "").strip(),
-                        code_voie=row.get("code_voie", "").strip(),
-                        voie=row.get("voie", "").strip(),
-                        code_postal=row.get("code_postal", "").strip(),
-                        commune=row.get("commune", "").strip(),
-                        code_departement=row.get("code_departement", "").strip(),
-                        code_commune=row.get("code_commune", "").strip(),
-                        prefixe_de_section=row.get("prefixe_de_section", "").strip(),
-                        section=row.get("section", "").strip(),
-                        no_plan=row.get("no_plan", "").strip(),
-                        no_volume=row.get("no_volume", "").strip(),
-                        nombre_de_lots=self._parse_int(row.get("nombre_de_lots")),
-                        code_type_local=row.get("code_type_local", "").strip(),
-                        type_local=row.get("type_local", "").strip(),
-                        identifiant_local=row.get("identifiant_local", "").strip(),
-                        surface_reelle_bati=self._parse_int(row.get("surface_reelle_bati")),
-                        nombre_pieces_principales=self._parse_int(row.get("nombre_pieces_principales")),
-                        nature_culture=row.get("nature_culture", "").strip(),
-                        nature_culture_speciale=row.get("nature_culture_speciale", "").strip(),
-                        surface_terrain=self._parse_int(row.get("surface_terrain")),
-                    )
+                if len(row) <= width:
+                    row += [""] * (width + 1 - len(row))
+                # One C-level pass per row instead of a .strip() call per text field.
+                row = list(map(str.strip, row))
+                date_mutation = _parse_date(row[idx["date_mutation"]])
+                yield CleanDVFRecord(
+                    date_mutation=date_mutation,
+                    nature_mutation=row[idx["nature_mutation"]],
+                    valeur_fonciere=_parse_decimal(row[idx["valeur_fonciere"]]),
+                    no_voie=row[idx["no_voie"]],
+                    btq=row[idx["btq"]],
+                    type_de_voie=row[idx["type_de_voie"]],
+                    code_voie=row[idx["code_voie"]],
+                    voie=row[idx["voie"]],
+                    code_postal=row[idx["code_postal"]],
+                    commune=row[idx["commune"]],
+                    code_departement=row[idx["code_departement"]],
+                    code_commune=row[idx["code_commune"]],
+                    prefixe_de_section=row[idx["prefixe_de_section"]],
+                    section=row[idx["section"]],
+                    no_plan=row[idx["no_plan"]],
+                    no_volume=row[idx["no_volume"]],
+                    nombre_de_lots=_parse_int(row[idx["nombre_de_lots"]]),
+                    code_type_local=row[idx["code_type_local"]],
+                    type_local=row[idx["type_local"]],
+                    identifiant_local=row[idx["identifiant_local"]],
+                    surface_reelle_bati=_parse_int(row[idx["surface_reelle_bati"]]),
+                    nombre_pieces_principales=_parse_int(row[idx["nombre_pieces_principales"]]),
+                    nature_culture=row[idx["nature_culture"]],
+                    nature_culture_speciale=row[idx["nature_culture_speciale"]],
+                    surface_terrain=_parse_int(row[idx["surface_terrain"]]),
+                    date_mutation_month=date_mutation.replace(day=1) if date_mutation else None,
                 )
-                if len(records_to_create) >= batch_size:
-                    CleanDVFRecord.objects.bulk_create(records_to_create, batch_size=batch_size)
-                    inserted += len(records_to_create)
-                    self.stdout.write(f"  Inserted {inserted} rows...")
-                    records_to_create.clear()
-        if records_to_create:
-            CleanDVFRecord.objects.bulk_create(records_to_create, batch_size=batch_size)
-            inserted += len(records_to_create)
+
+    def _copy_clean_records(self, path: Path, lean: bool = False, workers: int = 1):
+        self.stdout.write("Copying CleanDVFRecord dataset...")
+        try:
+            if lean:
+                inserted = self._copy_lean_columns(path)
+            elif workers > 1:
+                inserted = bulk.copy_file_parallel(CleanDVFRecord, path, workers)
+            else:
+                inserted = bulk.copy_file(CleanDVFRecord, path)
+        except FieldDoesNotExist as exc:
+            raise CommandError(f"{path.name} header does not match CleanDVFRecord: {exc}") from exc
+        # The file is copied verbatim, so derive the month column server-side.
+        fill_mutation_months()
         self.stdout.write(self.style.SUCCESS(f"Imported {inserted} CleanDVFRecord rows"))
 
-    def _parse_float(self, value: str):
-        if value is None:
-            return None
-        value = value.strip()
-        if not value:
-            return None
-        return float(value)
-
-    def _parse_int(self, value: str, allow_zero: bool = False):
-        if value is None:
-            return None
-        value = value.strip()
-        if not value:
-            return 0 if allow_zero else None
-        return int(value)
-
-    def _parse_decimal(self, value: str):
-        if value is None:
-            return None
-        value = value.strip()
-        if not value:
-            return None
-        return Decimal(value)
-
-    def _parse_date(self, value: str):
-        if value is None:
-            return None
-        value = value.strip()
-        if not value:
-            return None
-        return parse_date(value)
+    def _copy_lean_columns(self, path: Path) -> int:
+        # COPY cannot skip columns of its input, so the rows are re-emitted with
+        # the unused cells blanked (NULL, or '' for the NOT NULL text columns);
+        # the kept values are still passed through unparsed.
+        with path.open("r", encoding="utf-8", newline="") as fp:
+            reader = csv.reader(fp)
+            header = next(reader, [])
+            kept = [name in LEAN_FIELDS for name in header]
+            rows = ([cell if keep else "" for cell, keep in zip(row, kept)] for row in reader)
+            return bulk.copy_rows(CleanDVFRecord, header, rows)
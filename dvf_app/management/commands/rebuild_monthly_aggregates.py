@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from dvf_app.services.aggregates import rebuild_monthly_aggregates
+from dvf_app.services.cache import bump_data_version
+
+
+class Command(BaseCommand):
+    help = "Recompute the DVFMonthlyAgg summary table from the CleanDVFRecord rows."
+
+    def handle(self, *args, **options):
+        summary_rows = rebuild_monthly_aggregates()
+        bump_data_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {summary_rows} monthly aggregate rows"))
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.24 on 2026-10-15 22:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dvf_app', '0004_remove_commune_parcel_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cleandvfrecord',
+            index=models.Index(fields=['code_departement', 'code_commune'], name='cleandvf_dept_commune_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cleandvfrecord',
+            index=models.Index(fields=['date_mutation'], name='cleandvf_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cleandvfrecord',
+            index=models.Index(fields=['type_local', 'nature_mutation'], name='cleandvf_type_nature_idx'),
+        ),
+    ]
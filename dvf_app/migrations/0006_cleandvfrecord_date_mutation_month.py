@@ -0,0 +1,31 @@
+# Generated by Django 4.2.24 on 2026-10-15 22:44
+
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def fill_mutation_months(apps, schema_editor):
+    CleanDVFRecord = apps.get_model('dvf_app', 'CleanDVFRecord')
+    CleanDVFRecord.objects.using(schema_editor.connection.alias).filter(
+        date_mutation__isnull=False
+    ).update(date_mutation_month=TruncMonth('date_mutation'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dvf_app', '0005_cleandvfrecord_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cleandvfrecord',
+            name='date_mutation_month',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_mutation_months, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cleandvfrecord',
+            index=models.Index(fields=['date_mutation_month'], name='cleandvf_month_idx'),
+        ),
+    ]
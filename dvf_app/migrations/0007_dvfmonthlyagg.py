@@ -0,0 +1,34 @@
+# Generated by Django 4.2.24 on 2026-10-15 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dvf_app', '0006_cleandvfrecord_date_mutation_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DVFMonthlyAgg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code_departement', models.CharField(blank=True, max_length=3)),
+                ('code_commune', models.CharField(blank=True, max_length=10)),
+                ('month', models.DateField(blank=True, null=True)),
+                ('type_local', models.CharField(blank=True, max_length=100)),
+                ('nature_mutation', models.CharField(blank=True, max_length=100)),
+                ('sales_count', models.PositiveIntegerField(default=0)),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'verbose_name': 'DVF monthly aggregate',
+                'verbose_name_plural': 'DVF monthly aggregates',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dvfmonthlyagg',
+            constraint=models.UniqueConstraint(fields=('code_departement', 'code_commune', 'month', 'type_local', 'nature_mutation'), name='dvfmonthlyagg_group_uniq'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.24 on 2026-10-15 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dvf_app', '0007_dvfmonthlyagg'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+    ]
@@ -69,11 +69,27 @@ class CleanDVFRecord(models.Model):
     nature_culture = models.CharField(max_length=100, blank=True)
     nature_culture_speciale = models.CharField(max_length=100, blank=True)
     surface_terrain = models.PositiveIntegerField(null=True, blank=True)
+    # First day of the mutation month, stored so the monthly charts group on a
+    # plain indexed column instead of truncating every date. The importers fill
+    # it in bulk; save() keeps it in step for single-row edits.
+    date_mutation_month = models.DateField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Clean DVF record"
         verbose_name_plural = "Clean DVF records"
         ordering = ["-date_mutation", "commune", "code_postal"]
+        indexes = [
+            # Selection filters used by the chart service; the leading column also
+            # serves department-only filters.
+            models.Index(fields=["code_departement", "code_commune"], name="cleandvf_dept_commune_idx"),
+            models.Index(fields=["date_mutation"], name="cleandvf_date_idx"),
+            models.Index(fields=["type_local", "nature_mutation"], name="cleandvf_type_nature_idx"),
+            models.Index(fields=["date_mutation_month"], name="cleandvf_month_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.date_mutation_month = self.date_mutation.replace(day=1) if self.date_mutation else None
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         commune = self.commune or "Unknown locality"
@@ -95,3 +111,51 @@ class CleanDVFRecord(models.Model):
         return street or locality or ""
 
     address.short_description = "Address"
+
+
+class DVFMonthlyAgg(models.Model):
+    """Sales per commune, month, property type and mutation nature.
+
+    Rebuilt from CleanDVFRecord after every import (or with the
+    ``rebuild_monthly_aggregates`` command), and per commune when a single
+    record changes, so the chart totals group these rows instead of the raw
+    records. The bundled dumps give 46,356 rows for 242,500 records; sparse
+    data can approach one row per record.
+    """
+
+    code_departement = models.CharField(max_length=3, blank=True)
+    code_commune = models.CharField(max_length=10, blank=True)
+    month = models.DateField(null=True, blank=True)
+    type_local = models.CharField(max_length=100, blank=True)
+    nature_mutation = models.CharField(max_length=100, blank=True)
+    sales_count = models.PositiveIntegerField(default=0)
+    total_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "DVF monthly aggregate"
+        verbose_name_plural = "DVF monthly aggregates"
+        constraints = [
+            # Also serves the department/commune selection filters.
+            models.UniqueConstraint(
+                fields=["code_departement", "code_commune", "month", "type_local", "nature_mutation"],
+                name="dvfmonthlyagg_group_uniq",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        month = self.month.isoformat()[:7] if self.month else "unknown month"
+        return f"{self.code_departement}{self.code_commune} {month}: {self.sales_count} sales"
+
+
+class DataVersion(models.Model):
+    """Generation counter of the imported data, stored as a single row.
+
+    Cached payloads are keyed on it (see ``services.cache``). Keeping it in the
+    database rather than in the cache backend lets a bump from an import
+    process reach every web worker, whatever cache each of them uses.
+    """
+
+    version = models.PositiveIntegerField(default=1)
+
+    def __str__(self) -> str:
+        return f"Data version {self.version}"
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import Iterable, Tuple
+
+from django.db import connection, transaction
+from django.db.models.functions import TruncMonth
+
+from dvf_app.models import CleanDVFRecord, DVFMonthlyAgg
+from dvf_app.services.cache import cached_payload
+
+# Columns shared by the raw records and the summary rows, in GROUP BY order.
+GROUP_COLUMNS = ('code_departement', 'code_commune', 'type_local', 'nature_mutation')
+
+
+def summary_available() -> bool:
+    """Whether DVFMonthlyAgg has been built, checked once per data version.
+
+    Every rebuild is followed by a version bump, so the flag cannot outlive
+    the table state it describes.
+    """
+    return cached_payload('summary-available', compute=DVFMonthlyAgg.objects.exists)
+
+
+def fill_mutation_months() -> int:
+    """Derive ``date_mutation_month`` for rows loaded without it; returns the rows updated."""
+    return (
+        CleanDVFRecord.objects.filter(date_mutation__isnull=False, date_mutation_month__isnull=True)
+        .update(date_mutation_month=TruncMonth('date_mutation'))
+    )
+
+
+def _summary_insert_sql(where: str = '') -> str:
+    """INSERT ... SELECT filling DVFMonthlyAgg from the records matching ``where``."""
+    quote = connection.ops.quote_name
+    record_meta = CleanDVFRecord._meta
+    summary_meta = DVFMonthlyAgg._meta
+
+    def record_column(name: str) -> str:
+        return quote(record_meta.get_field(name).column)
+
+    def summary_column(name: str) -> str:
+        return quote(summary_meta.get_field(name).column)
+
+    targets = [*GROUP_COLUMNS, 'month', 'sales_count', 'total_value']
+    sources = [record_column(name) for name in GROUP_COLUMNS]
+    month = record_column('date_mutation_month')
+    if where:
+        where = 'WHERE ' + where.format(**{name: record_column(name) for name in GROUP_COLUMNS}) + ' '
+    return (
+        f"INSERT INTO {quote(summary_meta.db_table)} ({', '.join(summary_column(name) for name in targets)}) "
+        f"SELECT {', '.join(sources)}, {month}, COUNT(*), COALESCE(SUM({record_column('valeur_fonciere')}), 0) "
+        f"FROM {quote(record_meta.db_table)} "
+        f"{where}"
+        f"GROUP BY {', '.join(sources)}, {month}"
+    )
+
+
+def rebuild_monthly_aggregates() -> int:
+    """Recompute DVFMonthlyAgg from CleanDVFRecord with one INSERT ... SELECT.
+
+    Runs in the caller's transaction when there is one, so an import and its
+    summary commit together. Returns the number of summary rows.
+    """
+    sql = _summary_insert_sql()
+    with transaction.atomic():
+        DVFMonthlyAgg.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.rowcount
+
+
+def refresh_commune_aggregates(communes: Iterable[Tuple[str, str]]) -> None:
+    """Recompute the summary rows of the given (code_departement, code_commune) pairs.
+
+    Keeps the table in step with single-record edits; a summary that was never
+    built is left empty, since the charts then read the records directly.
+    """
+    if not DVFMonthlyAgg.objects.exists():
+        return
+    sql = _summary_insert_sql('{code_departement} = %s AND {code_commune} = %s')
+    with transaction.atomic(), connection.cursor() as cursor:
+        for code_departement, code_commune in set(communes):
+            DVFMonthlyAgg.objects.filter(code_departement=code_departement, code_commune=code_commune).delete()
+            cursor.execute(sql, [code_departement, code_commune])
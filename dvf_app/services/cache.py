@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Callable, TypeVar
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db.models import F
+
+from dvf_app.models import DataVersion
+
+T = TypeVar('T')
+
+DATA_VERSION_PK = 1
+# Stored in place of a None payload, which cache.get() cannot tell from a miss.
+CACHED_NONE = 'dvf:cached-none'
+
+# The version read by the current request, so a request that looks up several
+# payloads queries it once.
+_request_state = Local()
+
+
+def _start_request(**kwargs) -> None:
+    _request_state.version = None
+    _request_state.active = True
+
+
+def _finish_request(**kwargs) -> None:
+    # Drop the memoised version too, so code running after the request on
+    # this thread (or a reused worker context) reads the current row.
+    _request_state.version = None
+    _request_state.active = False
+
+
+request_started.connect(_start_request, dispatch_uid='dvf_cache_start_request')
+request_finished.connect(_finish_request, dispatch_uid='dvf_cache_finish_request')
+
+
+def data_version() -> int:
+    """Current generation of the imported data; part of every cached payload key.
+
+    Read from the database, so every worker process sees an import's bump on
+    its next request. Within a request the value is read once.
+    """
+    version = getattr(_request_state, 'version', None)
+    if version is None:
+        version = (
+            DataVersion.objects.filter(pk=DATA_VERSION_PK).values_list('version', flat=True).first() or 1
+        )
+        if getattr(_request_state, 'active', False):
+            _request_state.version = version
+    return version
+
+
+def bump_data_version() -> None:
+    """Invalidate every cached payload after the DVF tables change.
+
+    Old entries are simply never read again and expire on their own. The
+    update joins the caller's transaction, so readers switch to the new
+    version when the new data commits.
+    """
+    _request_state.version = None
+    updated = DataVersion.objects.filter(pk=DATA_VERSION_PK).update(version=F('version') + 1)
+    if not updated:
+        DataVersion.objects.get_or_create(pk=DATA_VERSION_PK, defaults={'version': 2})
+
+
+def cached_payload(namespace: str, *parts: object, compute: Callable[[], T]) -> T:
+    """Return the cached payload for ``parts``, computing and storing it on a miss.
+
+    A ``None`` result (e.g. an unknown department code) is cached as well, so
+    repeated lookups of a missing row do not reach the database.
+    """
+    # The digest only shortens the key; it is not a security boundary.
+    digest = hashlib.md5(repr(parts).encode('utf-8'), usedforsecurity=False).hexdigest()
+    key = f'dvf:{namespace}:{digest}'
+    version = data_version()
+    payload = cache.get(key, version=version)
+    if payload is None:
+        payload = compute()
+        stored = CACHED_NONE if payload is None else payload
+        cache.set(key, stored, timeout=getattr(settings, 'DVF_CACHE_TIMEOUT', 3600), version=version)
+        return payload
+    return None if payload == CACHED_NONE else payload
@@ -1,38 +1,67 @@
 from __future__ import annotations
 
+import heapq
 import math
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 from decimal import Decimal
+from operator import itemgetter
 from typing import Dict, List, Optional, Sequence, Tuple
 
-from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Min, Max, Q, Sum, Value, When
-from django.db.models.functions import Coalesce, TruncMonth
+from django.db import connections
+from django.db.models import (
+    Aggregate,
+    Case,
+    CharField,
+    Count,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Min,
+    Max,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce
 
-from ..models import CleanDVFRecord, Commune, Department
+from ..models import CleanDVFRecord, Commune, Department, DVFMonthlyAgg
+from .aggregates import summary_available
+from .cache import cached_payload
 from ..utils import normalize_commune_code, split_commune_code
 
 MAX_TOP_COMMUNES = 20
 DEFAULT_TOP_COMMUNES = 10
 MAX_TYPE_CATEGORIES = 5
+# Rows fetched per round trip when prices are streamed into Python; Django's
+# default of 2000 means hundreds of fetches for a national selection.
+PRICE_FETCH_CHUNK_SIZE = 10000
 
-def _price_per_sqm_expression() -> Case:
+def _price_per_sqm_expression(as_float: bool = False) -> Case:
+    """Price per m2, over the built surface when there is one, else the land surface.
+
+    ``as_float`` divides in double precision instead of ``numeric``, which is
+    far cheaper on PostgreSQL when the result only feeds float statistics.
+    """
+    if as_float:
+        value = Cast('valeur_fonciere', FloatField())
+        output_field = FloatField()
+    else:
+        value = F('valeur_fonciere')
+        output_field = DecimalField(max_digits=20, decimal_places=2)
     return Case(
         When(
             surface_reelle_bati__gt=0,
-            then=ExpressionWrapper(
-                F('valeur_fonciere') / F('surface_reelle_bati'),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            ),
+            then=ExpressionWrapper(value / F('surface_reelle_bati'), output_field=output_field),
         ),
         When(
             surface_terrain__gt=0,
-            then=ExpressionWrapper(
-                F('valeur_fonciere') / F('surface_terrain'),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            ),
+            then=ExpressionWrapper(value / F('surface_terrain'), output_field=output_field),
         ),
         default=None,
-        output_field=DecimalField(max_digits=20, decimal_places=2),
+        output_field=output_field,
     )
 
 DECIMAL_ZERO = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
@@ -67,23 +96,29 @@ def _percentile(sorted_values: Sequence[float], ratio: float) -> float:
     weight = position - lower_index
     return float(lower + (upper - lower) * weight)
 
-def _compute_box_stats(values: List[float]) -> Optional[Dict[str, float]]:
-    if not values:
-        return None
-    ordered = sorted(values)
-    q1 = _percentile(ordered, 0.25)
-    median = _percentile(ordered, 0.5)
-    q3 = _percentile(ordered, 0.75)
+def _whisker_bounds(q1: float, q3: float, raw_min: float, raw_max: float) -> Tuple[float, float]:
     iqr = max(q3 - q1, 0.0)
-    lower_candidate = q1 - 1.5 * iqr if iqr else ordered[0]
-    upper_candidate = q3 + 1.5 * iqr if iqr else ordered[-1]
-    display_min = float(max(ordered[0], lower_candidate))
-    display_max = float(min(ordered[-1], upper_candidate))
+    lower_candidate = q1 - 1.5 * iqr if iqr else raw_min
+    upper_candidate = q3 + 1.5 * iqr if iqr else raw_max
+    display_min = float(max(raw_min, lower_candidate))
+    display_max = float(min(raw_max, upper_candidate))
     if display_min > q1:
-        display_min = float(ordered[0])
+        display_min = float(raw_min)
     if display_max < q3:
-        display_max = float(ordered[-1])
-    outliers = [float(value) for value in ordered if value < display_min or value > display_max]
+        display_max = float(raw_max)
+    return display_min, display_max
+
+def _box_stats_payload(
+    q1: float,
+    median: float,
+    q3: float,
+    bounds: Tuple[float, float],
+    raw_min: float,
+    raw_max: float,
+    count: int,
+    outliers: List[float],
+) -> Dict[str, object]:
+    display_min, display_max = bounds
     return {
         'min': display_min,
         'q1': q1,
@@ -93,111 +128,219 @@ def _compute_box_stats(values: List[float]) -> Optional[Dict[str, float]]:
         'whiskerLow': display_min,
         'whiskerHigh': display_max,
         'outliers': outliers,
-        'rawMin': float(ordered[0]),
-        'rawMax': float(ordered[-1]),
-        'count': len(ordered),
+        'rawMin': float(raw_min),
+        'rawMax': float(raw_max),
+        'count': count,
     }
 
-def _build_type_filter(type_keys: Sequence[str]) -> Optional[Q]:
-    if not type_keys:
-        return None
-    non_empty = [key for key in type_keys if key]
-    clauses: List[Q] = []
-    if non_empty:
-        clauses.append(Q(type_local__in=non_empty))
-    if '' in type_keys:
-        clauses.append(Q(type_local__isnull=True) | Q(type_local__exact=''))
-    if not clauses:
+def _compute_box_stats(values: List[float]) -> Optional[Dict[str, float]]:
+    """Box-plot summary of ``values``; the list is sorted in place."""
+    if not values:
         return None
-    query = clauses[0]
-    for condition in clauses[1:]:
-        query |= condition
-    return query
+    ordered = values
+    ordered.sort()
+    q1 = _percentile(ordered, 0.25)
+    q3 = _percentile(ordered, 0.75)
+    bounds = _whisker_bounds(q1, q3, ordered[0], ordered[-1])
+    # Outliers are the sorted list's tails, so slice them out instead of
+    # testing every value.
+    outliers = ordered[:bisect_left(ordered, bounds[0])] + ordered[bisect_right(ordered, bounds[1]):]
+    return _box_stats_payload(
+        q1, _percentile(ordered, 0.5), q3, bounds, ordered[0], ordered[-1], len(ordered), outliers
+    )
+
+class _PercentileCont(Aggregate):
+    """PostgreSQL ``percentile_cont``; same linear interpolation as ``_percentile``.
+
+    Calls over the same ordering share one sort of the group's rows.
+    """
+    function = 'percentile_cont'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction: float, **extra):
+        super().__init__(expression, fraction=repr(float(fraction)), **extra)
+
+def _supports_percentiles(queryset) -> bool:
+    return connections[queryset.db].vendor == 'postgresql'
+
+def _database_box_stats(prices, with_outliers: bool = True) -> Dict[str, Dict[str, object]]:
+    """Box-plot summaries per ``group_key`` of ``prices``, computed by the database.
+
+    Only the quartiles, extremes and out-of-whisker values leave the server
+    instead of every price.
+    """
+    rows = (
+        prices.values('group_key')
+        .annotate(
+            count=Count('id'),
+            # Fractions 0 and 1 are the exact extremes and reuse the same sort.
+            raw_min=_PercentileCont('price_per_sqm', 0),
+            raw_max=_PercentileCont('price_per_sqm', 1),
+            q1=_PercentileCont('price_per_sqm', 0.25),
+            median=_PercentileCont('price_per_sqm', 0.5),
+            q3=_PercentileCont('price_per_sqm', 0.75),
+        )
+        .order_by()
+    )
+    # A constant group key degrades to a plain aggregate, which yields one row
+    # of NULLs for an empty selection.
+    summaries = {row['group_key']: row for row in rows if row['count']}
+    bounds = {
+        key: _whisker_bounds(row['q1'], row['q3'], row['raw_min'], row['raw_max'])
+        for key, row in summaries.items()
+    }
+    outliers: Dict[str, List[float]] = defaultdict(list)
+    if with_outliers and bounds:
+        outside = Q()
+        for key, (low, high) in bounds.items():
+            outside |= Q(group_key=key) & (Q(price_per_sqm__lt=low) | Q(price_per_sqm__gt=high))
+        for key, price in prices.filter(outside).values_list('group_key', 'price_per_sqm').order_by('price_per_sqm'):
+            outliers[key].append(price)
+    return {
+        key: _box_stats_payload(
+            row['q1'],
+            row['median'],
+            row['q3'],
+            bounds[key],
+            row['raw_min'],
+            row['raw_max'],
+            row['count'],
+            outliers[key],
+        )
+        for key, row in summaries.items()
+    }
+
+def _get_department(code: str) -> Optional[Department]:
+    """Department by code, cached like the chart payloads (until the next import)."""
+    return cached_payload('department', code, compute=lambda: Department.objects.filter(code=code).first())
+
+def _get_commune(code: str) -> Optional[Commune]:
+    """Commune (with its department) by INSEE code, cached like _get_department."""
+    return cached_payload(
+        'commune',
+        code,
+        compute=lambda: Commune.objects.select_related('department').filter(code_commune=code).first(),
+    )
 
 def _resolve_selection(department_code: str, commune_code: str):
     department_code = (department_code or '').strip().upper()
     commune_code = (commune_code or '').strip().upper()
 
-    records = CleanDVFRecord.objects.all()
+    # The same lookups select the raw records and their monthly summary rows.
+    lookups: Dict[str, str] = {}
+    matches_nothing = False
     level = 'national'
     department: Optional[Department] = None
     commune: Optional[Commune] = None
     top_scope_department_code: Optional[str] = None
 
     if commune_code:
-        commune = (
-            Commune.objects.select_related('department')
-            .filter(code_commune=commune_code)
-            .first()
-        )
+        commune = _get_commune(commune_code)
         dept_part, commune_part = split_commune_code(commune_code)
         if dept_part:
             top_scope_department_code = dept_part
-            records = records.filter(code_departement=dept_part)
+            lookups['code_departement'] = dept_part
         if commune_part is not None:
-            records = records.filter(code_commune=commune_part)
+            lookups['code_commune'] = commune_part
         else:
-            records = records.none()
+            matches_nothing = True
         if commune and commune.department:
             department = commune.department
         elif dept_part:
-            department = Department.objects.filter(code=dept_part).first()
+            department = _get_department(dept_part)
         level = 'commune'
         department_code = department.code if department else (dept_part or department_code)
     elif department_code:
-        records = records.filter(code_departement=department_code)
-        department = Department.objects.filter(code=department_code).first()
+        lookups['code_departement'] = department_code
+        department = _get_department(department_code)
         top_scope_department_code = department_code
         level = 'department'
 
+    records = CleanDVFRecord.objects.filter(**lookups)
+    summary = DVFMonthlyAgg.objects.filter(**lookups)
+    if matches_nothing:
+        records, summary = records.none(), summary.none()
+
     return {
         'level': level,
         'department': department,
         'department_code': department_code,
         'commune': commune,
         'records': records,
+        'summary': summary,
         'top_scope_department_code': top_scope_department_code,
         'selected_commune_code': commune.code_commune if commune else commune_code,
     }
 
-def _build_top_communes(department_code: Optional[str], selected_commune_code: Optional[str], limit: int) -> Dict[str, object]:
+def _sales_annotations(model) -> Dict[str, object]:
+    """``sales_count``/``total_value`` aggregates over raw records or DVFMonthlyAgg rows."""
+    if model is DVFMonthlyAgg:
+        return {
+            'sales_count': Sum('sales_count'),
+            'total_value': Coalesce(Sum('total_value'), DECIMAL_ZERO),
+        }
+    return {
+        'sales_count': Count('id'),
+        'total_value': Coalesce(Sum('valeur_fonciere'), DECIMAL_ZERO),
+    }
+
+def _build_top_communes(
+    department_code: Optional[str],
+    selected_commune_code: Optional[str],
+    limit: int,
+    model=CleanDVFRecord,
+) -> Dict[str, object]:
     limit = max(3, min(limit, MAX_TOP_COMMUNES))
-    qs = CleanDVFRecord.objects.exclude(code_commune__isnull=True).exclude(code_commune='')
+    qs = model.objects.exclude(code_commune__isnull=True).exclude(code_commune='')
     scope_label = 'France entiere'
     if department_code:
         qs = qs.filter(code_departement=department_code)
-        scope = Department.objects.filter(code=department_code).first()
+        scope = _get_department(department_code)
         if scope:
             scope_label = scope.name or f'Departement {scope.code}'
         else:
             scope_label = f'Departement {department_code}'
-    aggregates = list(
-        qs.values('code_departement', 'code_commune')
-        .annotate(
-            sales_count=Count('id'),
-            total_value=Coalesce(Sum('valeur_fonciere'), DECIMAL_ZERO),
-        )
+    grouped = (
+        qs.exclude(code_departement='')
+        .values('code_departement', 'code_commune')
+        .annotate(**_sales_annotations(model))
     )
-    items = []
-    commune_codes: List[str] = []
-    for row in aggregates:
-        code = normalize_commune_code(row.get('code_departement'), row.get('code_commune'))
-        if not code:
-            continue
-        commune_codes.append(code)
-        items.append(
-            {
-                'code': code,
-                'sales_count': int(row['sales_count'] or 0),
-                'total_value': _to_float(row['total_value']),
-            }
+    # Rank and cut in SQL: only the top rows (plus the selected commune, if it
+    # falls outside them) are normalised and matched to Commune rows. Ties are
+    # broken by code so the cut does not depend on the aggregation order.
+    rows = list(grouped.order_by('-sales_count', 'code_departement', 'code_commune')[:limit])
+    selected_code = (selected_commune_code or '').strip().upper()
+    top_codes = [normalize_commune_code(row['code_departement'], row['code_commune']) for row in rows]
+    # Only a canonical code can match a ranked row (and be flagged selected),
+    # so non-canonical input such as '1347' adds nothing.
+    dept_part, commune_part = split_commune_code(selected_code)
+    if (
+        selected_code
+        and selected_code not in top_codes
+        and normalize_commune_code(dept_part, commune_part) == selected_code
+    ):
+        selected_rows = list(
+            grouped.filter(code_departement=dept_part, code_commune=commune_part).order_by('-sales_count')[:1]
+        )
+        rows.extend(selected_rows)
+        top_codes.extend(
+            normalize_commune_code(row['code_departement'], row['code_commune']) for row in selected_rows
         )
+    top_items = [
+        {
+            'code': code,
+            'sales_count': int(row['sales_count'] or 0),
+            'total_value': _to_float(row['total_value']),
+        }
+        for code, row in zip(top_codes, rows)
+        if code
+    ]
     commune_lookup = {
         commune.code_commune: commune
-        for commune in Commune.objects.filter(code_commune__in=commune_codes).select_related('department')
+        for commune in Commune.objects.filter(code_commune__in=[item['code'] for item in top_items]).select_related('department')
     }
-    selected_code = (selected_commune_code or '').strip().upper()
-    for item in items:
+    for item in top_items:
         commune = commune_lookup.get(item['code'])
         if commune:
             item['label'] = commune.name
@@ -206,12 +349,7 @@ def _build_top_communes(department_code: Optional[str], selected_commune_code: O
             item['label'] = item['code']
             item['department_code'] = None
         item['is_selected'] = item['code'] == selected_code
-    items.sort(key=lambda entry: entry['sales_count'], reverse=True)
-    top_items = items[:limit]
-    selected_entry = next((entry for entry in items if entry['is_selected']), None)
-    if selected_entry and selected_entry not in top_items:
-        top_items.append(selected_entry)
-        top_items.sort(key=lambda entry: entry['sales_count'], reverse=True)
+    top_items.sort(key=itemgetter('sales_count'), reverse=True)
     for index, entry in enumerate(top_items, start=1):
         entry['rank'] = index
     return {
@@ -220,74 +358,104 @@ def _build_top_communes(department_code: Optional[str], selected_commune_code: O
         'limit': limit,
     }
 
-def _build_time_series(records) -> Dict[str, List[Dict[str, object]]]:
-    points = []
-    qs = (
-        records.exclude(date_mutation__isnull=True)
-        .annotate(month=TruncMonth('date_mutation'))
-        .values('month')
-        .annotate(
-            sales_count=Count('id'),
-            total_value=Coalesce(Sum('valeur_fonciere'), DECIMAL_ZERO),
-        )
-        .order_by('month')
-    )
-    for row in qs:
+def _aggregate_breakdown(rows) -> List[Dict[str, object]]:
+    """Sales per (month, type_local, nature_mutation) in a single GROUP BY.
+
+    The time series, type totals and mutation stack are all pivoted from these
+    rows instead of each scanning the selection again. ``rows`` is either the
+    selected raw records or their DVFMonthlyAgg summary rows.
+    """
+    if rows.model is DVFMonthlyAgg:
+        grouped = rows.values('type_local', 'nature_mutation', 'month')
+    else:
+        grouped = rows.values('type_local', 'nature_mutation', month=F('date_mutation_month'))
+    return list(grouped.annotate(**_sales_annotations(rows.model)).order_by())
+
+def _build_time_series(breakdown: Sequence[Dict[str, object]]) -> Dict[str, List[Dict[str, object]]]:
+    monthly_counts: Dict[object, int] = defaultdict(int)
+    monthly_values: Dict[object, Decimal] = defaultdict(Decimal)
+    for row in breakdown:
         month = row['month']
         if month is None:
             continue
+        monthly_counts[month] += int(row['sales_count'] or 0)
+        monthly_values[month] += row['total_value'] or 0
+    points = []
+    for month in sorted(monthly_counts):
         iso_month = month.date().isoformat() if hasattr(month, 'date') else month.isoformat()
         points.append(
             {
                 'month': iso_month,
-                'sales_count': int(row['sales_count'] or 0),
-                'total_value': _to_float(row['total_value']),
+                'sales_count': monthly_counts[month],
+                'total_value': _to_float(monthly_values[month]),
             }
         )
     return {'points': points}
 
-def _build_type_metrics(records) -> Tuple[List[str], Dict[str, int]]:
-    type_totals: Dict[str, int] = {}
-    qs = (
-        records.values('type_local')
-        .annotate(sales_count=Count('id'))
-        .order_by('-sales_count')
-    )
-    for row in qs:
+def _build_type_metrics(breakdown: Sequence[Dict[str, object]]) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+    """Top property types by sales, keyed by display label.
+
+    Raw ``type_local`` values sharing a label (blank and a literal 'Autre', or
+    spellings differing only in case) are counted as one type. Returns the top
+    labels, in order, mapped to their raw values, and the sales per label; ties
+    are broken on the label so the payload does not depend on row order.
+    """
+    label_totals: Dict[str, int] = defaultdict(int)
+    label_keys: Dict[str, set] = defaultdict(set)
+    for row in breakdown:
         key = row['type_local'] or ''
-        type_totals[key] = type_totals.get(key, 0) + int(row['sales_count'] or 0)
-    ordered = sorted(type_totals.items(), key=lambda entry: entry[1], reverse=True)
-    top_keys = [key for key, _ in ordered[:MAX_TYPE_CATEGORIES]]
-    return top_keys, type_totals
-
-def _build_price_boxplot(records, top_type_keys: Sequence[str]) -> Dict[str, object]:
-    type_filter = _build_type_filter(top_type_keys)
-    if type_filter is None:
-        return {'items': [], 'unit': 'EUR/m2'}
-    price_expr = _price_per_sqm_expression()
-    price_values: Dict[str, List[float]] = defaultdict(list)
-    qs = (
-        records.filter(type_filter)
-        .exclude(valeur_fonciere__isnull=True)
+        label = _clean_type_label(key)
+        label_totals[label] += int(row['sales_count'] or 0)
+        label_keys[label].add(key)
+    ordered = heapq.nsmallest(MAX_TYPE_CATEGORIES, label_totals.items(), key=lambda entry: (-entry[1], entry[0]))
+    top_types = {label: sorted(label_keys[label]) for label, _ in ordered}
+    return top_types, label_totals
+
+def _price_queryset(records):
+    """Records with a usable price per m2, annotated as ``price_per_sqm``."""
+    # percentile_cont orders double precision values, so divide in floats there.
+    price_expr = _price_per_sqm_expression(as_float=_supports_percentiles(records))
+    # The price is NULL exactly when neither surface is positive; testing the
+    # surfaces avoids evaluating the division once more in the WHERE clause.
+    return (
+        records.exclude(valeur_fonciere__isnull=True)
         .exclude(valeur_fonciere=0)
+        .filter(Q(surface_reelle_bati__gt=0) | Q(surface_terrain__gt=0))
         .annotate(price_per_sqm=price_expr)
-        .exclude(price_per_sqm__isnull=True)
-        .values_list('type_local', 'price_per_sqm')
     )
-    top_set = set(top_type_keys)
-    for type_value, price in qs.iterator():
-        key = type_value or ''
-        if key not in top_set:
-            continue
-        price_values[key].append(float(price))
+
+def _build_price_boxplot(records, top_types: Dict[str, List[str]]) -> Dict[str, object]:
+    if not top_types:
+        return {'items': [], 'unit': 'EUR/m2'}
+    label_by_key = {key: label for label, keys in top_types.items() for key in keys}
+    # type_local is NOT NULL, so the blank category is just '' and one IN list
+    # (usable by the type_local index) covers every top type.
+    prices = _price_queryset(records.filter(type_local__in=list(label_by_key)))
+    if _supports_percentiles(prices):
+        if len(label_by_key) == len(top_types):
+            # One raw value per label: group on the column itself.
+            stats_by_key = _database_box_stats(prices.annotate(group_key=F('type_local')))
+            stats_by_label = {label_by_key[key]: stats for key, stats in stats_by_key.items()}
+        else:
+            # Group on the label so the values merged under one type share a box.
+            group_key = Case(
+                *[When(type_local=key, then=Value(label)) for key, label in label_by_key.items()],
+                output_field=CharField(),
+            )
+            stats_by_label = _database_box_stats(prices.annotate(group_key=group_key))
+    else:
+        price_values: Dict[str, List[float]] = defaultdict(list)
+        for key, price in prices.values_list('type_local', 'price_per_sqm').iterator(chunk_size=PRICE_FETCH_CHUNK_SIZE):
+            price_values[label_by_key[key]].append(float(price))
+        stats_by_label = {label: _compute_box_stats(values) for label, values in price_values.items()}
     items = []
-    for key in top_type_keys:
-        stats = _compute_box_stats(price_values.get(key, []))
+    for label in top_types:
+        stats = stats_by_label.get(label)
         if not stats:
             continue
         items.append(
             {
-                'label': _clean_type_label(key),
+                'label': label,
                 'stats': stats,
             }
         )
@@ -295,18 +463,16 @@ def _build_price_boxplot(records, top_type_keys: Sequence[str]) -> Dict[str, obj
 
 
 def _collect_price_values(records) -> List[float]:
-    price_expr = _price_per_sqm_expression()
-    qs = (
-        records.exclude(valeur_fonciere__isnull=True)
-        .exclude(valeur_fonciere=0)
-        .annotate(price_per_sqm=price_expr)
-        .exclude(price_per_sqm__isnull=True)
-        .values_list('price_per_sqm', flat=True)
-    )
-    return [float(value) for value in qs.iterator()]
+    qs = _price_queryset(records).values_list('price_per_sqm', flat=True)
+    return [float(value) for value in qs.iterator(chunk_size=PRICE_FETCH_CHUNK_SIZE)]
 
 
 def _build_global_price_stats(records) -> Optional[Dict[str, float]]:
+    prices = _price_queryset(records)
+    if _supports_percentiles(prices):
+        # The selection KPIs only use the quartiles and whiskers.
+        grouped = prices.annotate(group_key=Value(''))
+        return _database_box_stats(grouped, with_outliers=False).get('')
     samples = _collect_price_values(records)
     return _compute_box_stats(samples) if samples else None
 
@@ -340,35 +506,28 @@ def _compute_selection_metrics(records):
         'date_max': date_max.isoformat() if date_max else None,
     }
 
-def _build_mutation_stack(records, top_type_keys: Sequence[str]) -> Dict[str, object]:
-    type_filter = _build_type_filter(top_type_keys)
-    if type_filter is None:
+def _build_mutation_stack(breakdown: Sequence[Dict[str, object]], top_types: Dict[str, List[str]]) -> Dict[str, object]:
+    if not top_types:
         return {'labels': [], 'series': []}
-    type_list = list(top_type_keys)
-    labels = [_clean_type_label(key) for key in type_list]
+    labels = list(top_types)
     mutation_data: Dict[str, List[int]] = {}
     totals: Dict[str, int] = defaultdict(int)
-    qs = (
-        records.filter(type_filter)
-        .values('type_local', 'nature_mutation')
-        .annotate(sales_count=Count('id'))
-    )
-    index_by_type = {key: idx for idx, key in enumerate(type_list)}
-    for row in qs:
+    index_by_key = {key: idx for idx, keys in enumerate(top_types.values()) for key in keys}
+    for row in breakdown:
         key = row['type_local'] or ''
-        if key not in index_by_type:
+        if key not in index_by_key:
             continue
         nature = (row['nature_mutation'] or 'Autre').strip() or 'Autre'
         if nature not in mutation_data:
-            mutation_data[nature] = [0] * len(type_list)
-        idx = index_by_type[key]
+            mutation_data[nature] = [0] * len(labels)
+        idx = index_by_key[key]
         count = int(row['sales_count'] or 0)
         mutation_data[nature][idx] += count
         totals[nature] += count
+    # Ties are ordered by nature so the series do not follow the row order.
     ordered_series = sorted(
         mutation_data.items(),
-        key=lambda entry: totals.get(entry[0], 0),
-        reverse=True,
+        key=lambda entry: (-totals.get(entry[0], 0), entry[0]),
     )
     series = [
         {
@@ -381,9 +540,25 @@ def _build_mutation_stack(records, top_type_keys: Sequence[str]) -> Dict[str, ob
     return {'labels': labels, 'series': series}
 
 def build_chart_payload(department_code: str, commune_code: str, top_limit: int = DEFAULT_TOP_COMMUNES) -> Dict[str, object]:
+    """Chart payload for a selection, cached until the TTL or the next import."""
+    top_limit = max(3, min(top_limit, MAX_TOP_COMMUNES))
+    return cached_payload(
+        'charts',
+        department_code,
+        commune_code,
+        top_limit,
+        compute=lambda: _build_chart_payload(department_code, commune_code, top_limit),
+    )
+
+
+def _build_chart_payload(department_code: str, commune_code: str, top_limit: int) -> Dict[str, object]:
     selection = _resolve_selection(department_code, commune_code)
     records = selection['records']
-    top_type_keys, type_totals = _build_type_metrics(records)
+    # Totals come from the summary table once an import has filled it; the
+    # price statistics and KPIs still need the raw records.
+    totals_source = selection['summary'] if summary_available() else records
+    breakdown = _aggregate_breakdown(totals_source)
+    top_types, type_totals = _build_type_metrics(breakdown)
     payload = {
         'selection': {
             'level': selection['level'],
@@ -413,15 +588,12 @@ def build_chart_payload(department_code: str, commune_code: str, top_limit: int
         selection['top_scope_department_code'],
         selection['selected_commune_code'],
         top_limit,
+        model=totals_source.model,
     )
-    payload['time_series'] = _build_time_series(records)
-    payload['price_boxplot'] = _build_price_boxplot(records, top_type_keys)
-    payload['mutation_stack'] = _build_mutation_stack(records, top_type_keys)
-    payload['type_totals'] = {
-        _clean_type_label(key): count
-        for key, count in type_totals.items()
-        if key in top_type_keys
-    }
+    payload['time_series'] = _build_time_series(breakdown)
+    payload['price_boxplot'] = _build_price_boxplot(records, top_types)
+    payload['mutation_stack'] = _build_mutation_stack(breakdown, top_types)
+    payload['type_totals'] = {label: type_totals[label] for label in top_types}
     payload['metrics'] = _compute_selection_metrics(records)
     return payload
 
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import CleanDVFRecord, Commune, Department
+from .services.aggregates import refresh_commune_aggregates
+from .services.cache import bump_data_version
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Commune)
+@receiver(post_delete, sender=Commune)
+def invalidate_reference_payloads(sender, **kwargs):
+    # Department and commune names are baked into the cached map context,
+    # commune options and chart payloads; the bulk imports bump the version
+    # themselves.
+    bump_data_version()
+
+
+@receiver(pre_save, sender=CleanDVFRecord)
+def remember_record_commune(sender, instance, **kwargs):
+    # An edit can move a record to another commune; both summaries change.
+    instance._previous_commune = None
+    if instance.pk is not None:
+        instance._previous_commune = (
+            CleanDVFRecord.objects.filter(pk=instance.pk)
+            .values_list("code_departement", "code_commune")
+            .first()
+        )
+
+
+@receiver(post_save, sender=CleanDVFRecord)
+@receiver(post_delete, sender=CleanDVFRecord)
+def refresh_record_summary(sender, instance, **kwargs):
+    # Single-record edits (admin, shell) keep DVFMonthlyAgg and the cached
+    # charts current; the imports write in bulk, bypass these signals and
+    # rebuild the whole summary instead.
+    communes = {(instance.code_departement, instance.code_commune)}
+    previous = getattr(instance, "_previous_commune", None)
+    if previous:
+        communes.add(previous)
+    refresh_commune_aggregates(communes)
+    bump_data_version()
@@ -1,3 +1,304 @@
-from django.test import TestCase
+from __future__ import annotations
 
-# Create your tests here.
+import datetime
+import sys
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import convert_valeurs_foncieres
+
+from .models import CleanDVFRecord, Commune, DataVersion, Department, DVFMonthlyAgg
+from .services import cache as dvf_cache
+from .services.aggregates import rebuild_monthly_aggregates
+from .services.cache import bump_data_version, cached_payload, data_version
+from .services.charts import _build_top_communes, _build_type_metrics
+
+# Sales per INSEE commune code; records store the code split as the DVF files
+# do (department '13', commune '47' for 13047).
+SALES = {
+    "13047": 5,
+    "13001": 3,
+    "13055": 1,
+    "10387": 4,
+    "10323": 3,
+    "10333": 2,
+    "10074": 1,
+}
+
+
+def _record(commune_code: str, **fields) -> CleanDVFRecord:
+    values = {
+        "date_mutation": datetime.date(2024, 3, 14),
+        "nature_mutation": "Vente",
+        "type_local": "Maison",
+        "valeur_fonciere": Decimal("200000"),
+        "surface_reelle_bati": 100,
+    }
+    values.update(fields)
+    values["date_mutation_month"] = values["date_mutation"].replace(day=1)
+    return CleanDVFRecord(
+        code_departement=commune_code[:2],
+        code_commune=commune_code[2:].lstrip("0"),
+        **values,
+    )
+
+
+class DVFDataTestCase(TestCase):
+    """Two departments, their communes and SALES records (summary not built)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        departments = {
+            "13": Department.objects.create(code="13", name="Bouches-du-Rhone"),
+            "10": Department.objects.create(code="10", name="Aube"),
+        }
+        for code in SALES:
+            Commune.objects.create(
+                code_commune=code,
+                department=departments[code[:2]],
+                name=f"Commune {code}",
+                postal_codes=f"{code[:2]}100",
+            )
+        CleanDVFRecord.objects.bulk_create(
+            _record(code) for code, count in SALES.items() for _ in range(count)
+        )
+
+    def setUp(self):
+        # Rolled-back tests reuse the same data version, so cached payloads
+        # from a previous test would otherwise be served.
+        cache.clear()
+
+
+class TopCommunesSelectionTests(DVFDataTestCase):
+    def codes(self, payload):
+        return [item["code"] for item in payload["items"]]
+
+    def test_ranked_selection_is_flagged_not_appended(self):
+        payload = _build_top_communes("13", "13047", 3)
+        self.assertEqual(self.codes(payload), ["13047", "13001", "13055"])
+        self.assertEqual([item["is_selected"] for item in payload["items"]], [True, False, False])
+
+    def test_unranked_selection_is_appended(self):
+        payload = _build_top_communes("10", "10074", 3)
+        self.assertEqual(self.codes(payload), ["10387", "10323", "10333", "10074"])
+        self.assertTrue(payload["items"][-1]["is_selected"])
+        self.assertEqual([item["rank"] for item in payload["items"]], [1, 2, 3, 4])
+
+    def test_non_canonical_code_of_ranked_commune_is_not_duplicated(self):
+        payload = _build_top_communes("13", "1347", 3)
+        self.assertEqual(self.codes(payload), ["13047", "13001", "13055"])
+        self.assertFalse(any(item["is_selected"] for item in payload["items"]))
+
+    def test_non_canonical_code_is_not_appended(self):
+        payload = _build_top_communes("10", "1074", 3)
+        self.assertEqual(self.codes(payload), ["10387", "10323", "10333"])
+        self.assertFalse(any(item["is_selected"] for item in payload["items"]))
+
+
+class CleanDVFRecordAdminTests(DVFDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def record_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        table = CleanDVFRecord._meta.db_table
+        return [query["sql"] for query in queries if f'"{table}"' in query["sql"] and "COUNT(" not in query["sql"]]
+
+    def test_changelist_skips_unused_columns(self):
+        queries = self.record_queries(reverse("admin:dvf_app_cleandvfrecord_changelist"))
+        # The list_filter choices come from DISTINCT queries on the same table.
+        (listing,) = [sql for sql in queries if "DISTINCT" not in sql]
+        self.assertIn('"voie"', listing)
+        self.assertNotIn('"nature_culture"', listing)
+
+    def test_change_form_loads_the_record_in_one_query(self):
+        record = CleanDVFRecord.objects.first()
+        queries = self.record_queries(reverse("admin:dvf_app_cleandvfrecord_change", args=[record.pk]))
+        self.assertEqual(len(queries), 1)
+
+
+class SummaryPayloadTests(DVFDataTestCase):
+    """The heatmap and charts payloads are the same from the records and from DVFMonthlyAgg."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        CleanDVFRecord.objects.bulk_create(
+            [
+                _record("13047", type_local="Appartement", date_mutation=datetime.date(2024, 1, 9), surface_reelle_bati=50),
+                _record("13047", type_local="", nature_mutation="Echange"),
+                _record("13001", type_local="autre", date_mutation=datetime.date(2024, 2, 2)),
+            ]
+        )
+
+    URLS = [
+        ("dvf_app:heatmap-data", {}),
+        ("dvf_app:heatmap-data", {"department": "13"}),
+        ("dvf_app:heatmap-data", {"commune": "13047"}),
+        ("dvf_app:charts-data", {}),
+        ("dvf_app:charts-data", {"department": "13"}),
+        ("dvf_app:charts-data", {"department": "10", "commune": "10074"}),
+    ]
+
+    def payloads(self):
+        return [self.client.get(reverse(name), params).json() for name, params in self.URLS]
+
+    def test_summary_matches_records(self):
+        from_records = self.payloads()
+        self.assertFalse(DVFMonthlyAgg.objects.exists())
+
+        call_command("rebuild_monthly_aggregates", stdout=StringIO())
+        self.assertTrue(DVFMonthlyAgg.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            from_summary = self.payloads()
+        self.assertTrue(any(DVFMonthlyAgg._meta.db_table in query["sql"] for query in queries))
+
+        self.assertEqual(from_summary, from_records)
+
+    def test_heatmap_totals(self):
+        summary = self.client.get(reverse("dvf_app:heatmap-data")).json()["summary"]
+        self.assertEqual(summary["total_sales"], sum(SALES.values()) + 3)
+        self.assertEqual(summary["level"], "department")
+
+        points = self.client.get(reverse("dvf_app:heatmap-data"), {"department": "13"}).json()["points"]
+        self.assertEqual([(point["code"], point["sales_count"]) for point in points][:2], [("13047", 7), ("13001", 4)])
+
+
+class SummaryConsistencyTests(DVFDataTestCase):
+    """Single-record edits keep DVFMonthlyAgg equal to a full rebuild."""
+
+    def setUp(self):
+        super().setUp()
+        rebuild_monthly_aggregates()
+
+    def summary_rows(self):
+        return sorted(
+            DVFMonthlyAgg.objects.values_list(
+                "code_departement", "code_commune", "month", "type_local", "nature_mutation", "sales_count", "total_value"
+            )
+        )
+
+    def assertSummaryCurrent(self):
+        rows = self.summary_rows()
+        rebuild_monthly_aggregates()
+        self.assertEqual(rows, self.summary_rows())
+
+    def commune_sales(self, code):
+        payload = self.client.get(reverse("dvf_app:heatmap-data"), {"commune": code}).json()
+        return payload["summary"]["total_sales"]
+
+    def test_create(self):
+        self.assertEqual(self.commune_sales("13055"), 1)
+        _record("13055", type_local="Appartement").save()
+        self.assertSummaryCurrent()
+        self.assertEqual(self.commune_sales("13055"), 2)
+
+    def test_move_to_another_commune(self):
+        record = CleanDVFRecord.objects.filter(code_departement="13", code_commune="55").get()
+        record.code_commune = "1"
+        record.save()
+        self.assertSummaryCurrent()
+        self.assertFalse(DVFMonthlyAgg.objects.filter(code_departement="13", code_commune="55").exists())
+        self.assertEqual(self.commune_sales("13001"), 4)
+
+    def test_delete(self):
+        self.assertEqual(self.commune_sales("10074"), 1)
+        CleanDVFRecord.objects.filter(code_departement="10", code_commune="74").get().delete()
+        self.assertSummaryCurrent()
+        self.assertEqual(self.commune_sales("10074"), 0)
+
+
+class CacheVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_changes_the_version_and_the_payload(self):
+        version = data_version()
+        self.assertEqual(cached_payload("test", 1, compute=lambda: "old"), "old")
+        bump_data_version()
+        self.assertEqual(data_version(), version + 1)
+        self.assertEqual(cached_payload("test", 1, compute=lambda: "new"), "new")
+
+    def test_none_is_cached(self):
+        compute = mock.Mock(return_value=None)
+        self.assertIsNone(cached_payload("test", "missing", compute=compute))
+        self.assertIsNone(cached_payload("test", "missing", compute=compute))
+        compute.assert_called_once_with()
+
+    def test_version_is_read_once_per_request(self):
+        version = data_version()
+        dvf_cache._start_request()
+        try:
+            self.assertEqual(data_version(), version)
+            # Another process's import.
+            DataVersion.objects.update_or_create(pk=dvf_cache.DATA_VERSION_PK, defaults={"version": version + 5})
+            self.assertEqual(data_version(), version)
+        finally:
+            dvf_cache._finish_request()
+        self.assertEqual(data_version(), version + 5)
+
+
+class TypeMetricsTests(SimpleTestCase):
+    def test_labels_differing_in_case_or_blank_are_merged(self):
+        breakdown = [
+            {"type_local": "", "sales_count": 1},
+            {"type_local": "Autre", "sales_count": 1},
+            {"type_local": "autre", "sales_count": 1},
+            {"type_local": "Maison", "sales_count": 2},
+        ]
+        top_types, totals = _build_type_metrics(breakdown)
+        self.assertEqual(list(top_types), ["Autre", "Maison"])
+        self.assertEqual(top_types["Autre"], ["", "Autre", "autre"])
+        self.assertEqual(totals["Autre"], 3)
+
+    def test_ties_are_ordered_by_label(self):
+        breakdown = [{"type_local": label, "sales_count": 2} for label in ("Maison", "Dependance", "Appartement")]
+        for rows in (breakdown, breakdown[::-1]):
+            top_types, _ = _build_type_metrics(rows)
+            self.assertEqual(list(top_types), ["Appartement", "Dependance", "Maison"])
+
+
+class ConvertValeursFoncieresTests(SimpleTestCase):
+    SOURCE = "Date|Valeur|Commune\r\n02/01/2024|185000,00|MARSEILLE 1ER\r\n03/01/2024||AIX\r\n"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.tmp = Path(directory.name)
+        self.src = self.tmp / "source.txt"
+        self.src.write_bytes(self.SOURCE.encode("cp1252"))
+
+    def convert(self, name, **options):
+        dest = self.tmp / name
+        convert_valeurs_foncieres.convert_file(self.src, dest, "cp1252", "utf-8-sig", ";", **options)
+        return dest.read_bytes()
+
+    def test_fast_path_matches_safe_path(self):
+        fast = self.convert("fast.csv")
+        self.assertEqual(fast, self.convert("safe.csv", safe=True))
+        self.assertEqual(fast, self.convert("no-quote-scan.csv", safe=True, no_quote_scan=True))
+        self.assertTrue(fast.startswith("\ufeffDate;Valeur;Commune\r\n".encode("utf-8")))
+
+    def test_fast_is_the_default(self):
+        args = convert_valeurs_foncieres.build_parser().parse_args([str(self.src), "out.csv"])
+        self.assertFalse(args.safe)
+
+    def test_no_quote_scan_requires_safe(self):
+        argv = ["convert_valeurs_foncieres.py", str(self.src), str(self.tmp / "out.csv"), "--no-quote-scan"]
+        with mock.patch.object(sys, "argv", argv), mock.patch("sys.stderr", StringIO()):
+            with self.assertRaises(SystemExit):
+                convert_valeurs_foncieres.main()
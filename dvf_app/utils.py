@@ -1,33 +1,35 @@
 from __future__ import annotations
 
+import re
+from functools import lru_cache
 from typing import Optional, Tuple
 
+# Department prefix of an INSEE commune code: Corsica (2A/2B), a three-character
+# overseas code when something follows it, otherwise the first two characters.
+_COMMUNE_CODE_RE = re.compile(r'(2[AB]|9[78].(?=.)|.{1,2})(.*)', re.DOTALL)
+_OVERSEAS_PREFIXES = ('97', '98')
+
+def get_upper_param(request, key: str, default: str = '') -> str:
+    """Return the ``key`` query parameter stripped and upper-cased, as codes are stored."""
+    return (request.GET.get(key) or default).strip().upper()
+
 def split_commune_code(commune_code: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
     code = (commune_code or '').strip().upper()
     if not code:
         return None, None
-    if code.startswith(('2A', '2B')):
-        dept = code[:2]
-        rest = code[2:]
-    elif code.startswith(('97', '98')) and len(code) >= 4:
-        dept = code[:3]
-        rest = code[3:]
-    else:
-        dept = code[:2]
-        rest = code[2:]
+    dept, rest = _COMMUNE_CODE_RE.match(code).groups()
     rest = rest.lstrip('0') or '0'
     return dept, rest
 
+# Called once per aggregated row; the (department, commune) pairs are limited to
+# the ~35k communes, so results are memoised.
+@lru_cache(maxsize=1 << 16)
 def normalize_commune_code(department_code: Optional[str], commune_code: Optional[str]) -> Optional[str]:
     dept = (department_code or '').strip().upper()
     commune = (commune_code or '').strip()
     if not dept or not commune:
         return None
-    if dept in {'2A', '2B'}:
-        padded_commune = commune.zfill(3)
-    elif dept.startswith('97') or dept.startswith('98'):
-        padded_commune = commune.zfill(2)
-    else:
-        padded_commune = commune.zfill(3)
-        dept = dept.zfill(2)
-    return f"{dept}{padded_commune}"
+    # Corsican and overseas codes are already two characters or more.
+    dept = dept.zfill(2)
+    width = 2 if dept[:2] in _OVERSEAS_PREFIXES else 3
+    return f"{dept}{commune.zfill(width)}"
@@ -1,45 +1,129 @@
 from __future__ import annotations
 
-from django.db.models import Count
-from django.http import JsonResponse
+import json
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_GET
 from django.views.generic import TemplateView
 
-from .models import CleanDVFRecord, Commune, Department
+from .models import CleanDVFRecord, Commune, Department, DVFMonthlyAgg
+from .services.aggregates import summary_available
+from .services.cache import cached_payload
 from .services.charts import (
     DEFAULT_TOP_COMMUNES,
     build_chart_payload,
     compute_selection_metrics,
 )
-from .utils import normalize_commune_code, split_commune_code
+from .utils import get_upper_param, normalize_commune_code, split_commune_code
+
+try:  # orjson encodes straight to bytes and is much faster than the stdlib.
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# orjson hands the types it does not know (Decimal, lazy strings) to the same
+# fallbacks JsonResponse uses.
+_django_json_default = DjangoJSONEncoder().default
+
+
+def _json_bytes(payload) -> bytes:
+    """Serialise ``payload`` like ``JsonResponse``, with orjson when it is installed."""
+    if orjson is None:
+        return json.dumps(payload, cls=DjangoJSONEncoder).encode()
+    return orjson.dumps(payload, default=_django_json_default)
+
+
+def _json_response(payload) -> HttpResponse:
+    return HttpResponse(_json_bytes(payload), content_type="application/json")
+
 
 class LeafletMapView(TemplateView):
     template_name = "dvf_app/map.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        departments = Department.objects.order_by("code").values("code", "name")
-        context["departments"] = [
-            {
-                "code": dept["code"],
-                "name": dept["name"] or f"Departement {dept['code']}",
-            }
-            for dept in departments
-        ]
+        context["departments"] = cached_payload("departments", compute=_department_options)
         return context
 
 
+def _department_options():
+    departments = Department.objects.order_by("code").values("code", "name")
+    return [
+        {
+            "code": dept["code"],
+            "name": dept["name"] or f"Departement {dept['code']}",
+        }
+        for dept in departments
+    ]
+
+
+# Commune columns read for a heatmap point and its department's summary.
+_COMMUNE_POINT_FIELDS = (
+    "code_commune",
+    "name",
+    "centroid_lat",
+    "centroid_lon",
+    "address_count",
+    "postal_codes",
+    "department__code",
+    "department__name",
+    "department__address_count",
+    "department__commune_count",
+)
+
+
+def _commune_point(code, commune, sales_count):
+    return {
+        "code": code,
+        "name": commune["name"],
+        "department_code": commune["department__code"],
+        "centroid_lat": commune["centroid_lat"],
+        "centroid_lon": commune["centroid_lon"],
+        "address_count": commune["address_count"],
+        "postal_codes": list(filter(None, commune["postal_codes"].split(","))),
+        "sales_count": sales_count,
+    }
+
+
+def _departments_from_communes(communes):
+    return {
+        commune["department__code"]: {
+            "code": commune["department__code"],
+            "name": commune["department__name"],
+            "address_count": commune["department__address_count"],
+            "commune_count": commune["department__commune_count"],
+        }
+        for commune in communes
+    }
+
+
 @require_GET
 def heatmap_data(request):
-    department_param = (request.GET.get("department") or "").strip().upper()
-    commune_param = (request.GET.get("commune") or "").strip().upper()
+    department_param = get_upper_param(request, "department")
+    commune_param = get_upper_param(request, "commune")
 
     records = CleanDVFRecord.objects.exclude(code_commune__isnull=True).exclude(
         code_commune=""
     )
+    # Sales counts come from the monthly summary once an import has filled it.
+    if summary_available():
+        sales_rows = DVFMonthlyAgg.objects.exclude(code_commune="")
+        sales_count = Sum("sales_count")
+    else:
+        sales_rows = records
+        # COUNT(*) rather than COUNT(id) lets PostgreSQL answer from the
+        # (code_departement, code_commune) index alone.
+        sales_count = Count("*")
 
     level = "commune"
     points = []
+    total_sales = 0
+    # Departments already loaded by either branch, reused for the summary.
+    departments_by_code = {}
+    summary_commune = None
 
     if commune_param:
         dept_part, commune_part = split_commune_code(commune_param)
@@ -48,82 +132,106 @@ def heatmap_data(request):
                 code_departement=dept_part,
                 code_commune=commune_part,
             )
+            sales_rows = sales_rows.filter(
+                code_departement=dept_part,
+                code_commune=commune_part,
+            )
             if not department_param:
                 department_param = dept_part
         else:
             records = records.none()
+            sales_rows = sales_rows.none()
     elif department_param:
         records = records.filter(code_departement=department_param)
+        sales_rows = sales_rows.filter(code_departement=department_param)
     else:
         level = "department"
 
     metrics = compute_selection_metrics(records)
 
     if level == "department":
-        department_totals = (
-            records.values("code_departement").annotate(sales_count=Count("id"))
+        # One query: each department carries its sales count from a correlated
+        # subquery keyed on code_departement. Departments without sales get
+        # NULL and are skipped here rather than filtered in SQL, which would
+        # evaluate the subquery a second time.
+        department_sales = (
+            sales_rows.filter(code_departement=OuterRef("code"))
+            .order_by()
+            .values("code_departement")
+            .annotate(sales_count=sales_count)
+            .values("sales_count")
+        )
+        departments = (
+            Department.objects.annotate(sales_count=Subquery(department_sales))
+            .values("code", "name", "centroid_lat", "centroid_lon", "address_count", "commune_count", "sales_count")
         )
-        for row in department_totals:
-            code = (row["code_departement"] or "").upper()
-            department = Department.objects.filter(code=code).first()
-            if not department:
+        for department in departments:
+            if department["sales_count"] is None:
                 continue
             points.append(
                 {
-                    "code": department.code,
-                    "name": department.name or f"Departement {department.code}",
-                    "centroid_lat": department.centroid_lat,
-                    "centroid_lon": department.centroid_lon,
-                    "address_count": department.address_count,
-                    "commune_count": department.commune_count,
-                    "sales_count": row["sales_count"],
+                    "code": department["code"],
+                    "name": department["name"] or f"Departement {department['code']}",
+                    "centroid_lat": department["centroid_lat"],
+                    "centroid_lon": department["centroid_lon"],
+                    "address_count": department["address_count"],
+                    "commune_count": department["commune_count"],
+                    "sales_count": department["sales_count"],
                 }
             )
+            total_sales += department["sales_count"]
+    elif commune_param:
+        # At most one point: a single aggregate and one commune row, without
+        # the GROUP BY/lookup pipeline used for a whole department.
+        commune_total = sales_rows.aggregate(sales_count=sales_count)["sales_count"]
+        code = normalize_commune_code(dept_part, commune_part)
+        commune = None
+        if commune_total and code:
+            commune = Commune.objects.filter(code_commune=code).values(*_COMMUNE_POINT_FIELDS).first()
+        if commune:
+            departments_by_code = _departments_from_communes([commune])
+            points.append(_commune_point(code, commune, commune_total))
+            total_sales = commune_total
+            if code == commune_param:
+                summary_commune = {
+                    "code": code,
+                    "name": commune["name"],
+                    "department_code": commune["department__code"],
+                }
     else:
-        aggregates = []
-        for row in records.values("code_departement", "code_commune").annotate(
-            sales_count=Count("id")
+        # One pass normalises the codes and collects them for the lookup.
+        commune_sales = []
+        commune_codes = set()
+        for dept_code, commune_code, commune_total in (
+            sales_rows.values_list("code_departement", "code_commune")
+            .annotate(sales_count=sales_count)
+            .order_by()
         ):
-            normalized = normalize_commune_code(
-                row["code_departement"], row["code_commune"]
-            )
+            normalized = normalize_commune_code(dept_code, commune_code)
             if not normalized:
                 continue
-            aggregates.append(
-                {
-                    "code_commune": normalized,
-                    "sales_count": row["sales_count"],
-                }
-            )
+            commune_sales.append((normalized, commune_total))
+            commune_codes.add(normalized)
 
-        commune_codes = [row["code_commune"] for row in aggregates]
+        # Plain rows joined to their department: the points and the summary
+        # only read a few columns, so no model instances are built.
         commune_lookup = {
-            commune.code_commune: commune
-            for commune in Commune.objects.filter(code_commune__in=commune_codes).select_related("department")
+            commune["code_commune"]: commune
+            for commune in Commune.objects.filter(code_commune__in=commune_codes).values(
+                *_COMMUNE_POINT_FIELDS
+            )
         }
 
-        for row in aggregates:
-            code = row["code_commune"]
+        departments_by_code = _departments_from_communes(commune_lookup.values())
+        for code, commune_total in commune_sales:
             commune = commune_lookup.get(code)
             if not commune:
                 continue
-            points.append(
-                {
-                    "code": code,
-                    "name": commune.name,
-                    "department_code": commune.department.code,
-                    "centroid_lat": commune.centroid_lat,
-                    "centroid_lon": commune.centroid_lon,
-                    "address_count": commune.address_count,
-                    "postal_codes": [pc for pc in commune.postal_codes.split(",") if pc],
-                    "sales_count": row["sales_count"],
-                }
-            )
-
-    points.sort(key=lambda item: item["sales_count"], reverse=True)
+            points.append(_commune_point(code, commune, commune_total))
+            total_sales += commune_total
 
-    total_sales = sum(point["sales_count"] for point in points)
-    max_sales = max((point["sales_count"] for point in points), default=0)
+    points.sort(key=itemgetter("sales_count"), reverse=True)
+    max_sales = points[0]["sales_count"] if points else 0
 
     summary = {
         "total_sales": total_sales,
@@ -134,11 +242,13 @@ def heatmap_data(request):
     summary.update(metrics)
 
     if department_param:
-        department = (
-            Department.objects.filter(code=department_param)
-            .values("code", "name", "address_count", "commune_count")
-            .first()
-        )
+        department = departments_by_code.get(department_param)
+        if department is None:
+            department = (
+                Department.objects.filter(code=department_param)
+                .values("code", "name", "address_count", "commune_count")
+                .first()
+            )
         if department:
             summary["department"] = {
                 "code": department["code"],
@@ -147,43 +257,47 @@ def heatmap_data(request):
                 "commune_count": department["commune_count"],
             }
 
-    if commune_param and level == "commune":
-        commune = next((p for p in points if p["code"] == commune_param), None)
-        if commune:
-            summary["commune"] = {
-                "code": commune["code"],
-                "name": commune["name"],
-                "department_code": commune.get("department_code"),
-            }
+    if summary_commune:
+        summary["commune"] = summary_commune
 
-    return JsonResponse({"summary": summary, "points": points})
+    return _json_response({"summary": summary, "points": points})
 
 
 @require_GET
 def commune_options(request):
-    department_code = (request.GET.get("department") or "").strip().upper()
+    department_code = get_upper_param(request, "department")
     if not department_code:
         return JsonResponse({"communes": []})
 
+    # The dropdown asks again on every department change; keep the encoded
+    # body until the next import.
+    body = cached_payload(
+        "communes",
+        department_code,
+        compute=lambda: _json_bytes({"communes": _commune_options(department_code)}),
+    )
+    return HttpResponse(body, content_type="application/json")
+
+
+def _commune_options(department_code: str):
     communes = (
         Commune.objects.filter(department__code=department_code)
         .order_by("name")
         .values("code_commune", "name")
     )
-    options = [
+    return [
         {"code_commune": commune["code_commune"], "name": commune["name"]}
         for commune in communes
     ]
-    return JsonResponse({"communes": options})
 
 @require_GET
 def charts_data(request):
-    department_param = (request.GET.get("department") or "").strip().upper()
-    commune_param = (request.GET.get("commune") or "").strip().upper()
+    department_param = get_upper_param(request, "department")
+    commune_param = get_upper_param(request, "commune")
     try:
         top_limit = int(request.GET.get("top_limit") or DEFAULT_TOP_COMMUNES)
     except ValueError:
         top_limit = DEFAULT_TOP_COMMUNES
     payload = build_chart_payload(department_param, commune_param, top_limit)
-    return JsonResponse(payload)
+    return _json_response(payload)
 